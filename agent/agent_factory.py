@@ -1,56 +1,23 @@
-import os, logging, pytz
-from datetime import datetime
+import os, logging
 from agno.agent import Agent
 from agno.models.openai import OpenAILike
-from agno.memory.manager import MemoryManager
 from agno.tools import Toolkit
-from exa_py import Exa
 from core.config import *
-from typing import Optional
-
-# --- SAFE IMPORT FOR STORAGE ---
-try:
-    from agno.storage.agent.postgres import PgAgentStorage
-except ImportError:
-    PgAgentStorage = None
-
-# Import Firecrawl
-try:
-    from firecrawl import FirecrawlApp
-except ImportError:
-    FirecrawlApp = None
+from core.http_client import get_http_client
+from agent.agent_storage import agent_storage
+from core.metrics import span
+from agent.prompt_layout import stable_instructions, build_turn_context
+from tools.web_tools import web_search, scrape_website
+from typing import Optional, Dict, List, Tuple
+from contextlib import asynccontextmanager
+from uuid import uuid4
 
 logger = logging.getLogger("AgentFactory")
 
-# --- GLOBAL TOOL CLIENTS ---
-exa_client = Exa(api_key=EXA_API_KEY) if EXA_API_KEY else None
-firecrawl_client = FirecrawlApp(api_key=FIRECRAWL_API_KEY) if FIRECRAWL_API_KEY and FirecrawlApp else None
-
-def web_search(query: str) -> str:
-    if not exa_client: return "Error: Exa Client not initialized."
-    try:
-        response = exa_client.search_and_contents(query, num_results=EXA_NUM_RESULTS, text=True)
-        return str(response)
-    except Exception as e:
-        logger.error(f"Exa search failed: {e}")
-        return "Error: Web search failed."
-
-def scrape_website(url: str) -> str:
-    if not firecrawl_client: return "Error: Firecrawl Client not initialized."
-    try:
-        result = firecrawl_client.scrape_url(url, params={'formats': ['markdown']})
-        return result.get('markdown', 'No content.')[:SCRAPE_MAX_CHARS]
-    except Exception as e:
-        logger.error(f"Firecrawl scrape failed: {e}")
-        return "Error: Website scraping failed."
-
-def create_hero_agent(api_key: str, history_str: str, model_id: str = None, is_openrouter: bool = False, bio_tools: Optional[Toolkit] = None):
-    """
-    Creates the Hero Agent with fixed Model ID handling for OpenRouter.
-    """
-    
+def _resolve_model_ids(model_id: Optional[str], is_openrouter: bool) -> Tuple[str, str, str]:
+    """Returns (base_url, chat_model_id, memory_model_id) for the provider."""
     if is_openrouter:
-        base_url = "https://openrouter.ai/api/v1"
+        base_url = OPENROUTER_BASE_URL
         # Ensure model ID includes provider prefix if not present
         chat_model_id = model_id or OPENROUTER_MODEL
         if "/" not in chat_model_id:
@@ -58,50 +25,96 @@ def create_hero_agent(api_key: str, history_str: str, model_id: str = None, is_o
             
         memory_model_id = os.getenv("OPENROUTER_MEMORY_MODEL", "meta-llama/llama-3.1-8b-instruct")
     else:
-        base_url = "https://api.groq.com/openai/v1"
+        base_url = GROQ_BASE_URL
         chat_model_id = model_id or GROQ_MODEL
         memory_model_id = GROQ_MEMORY_MODEL
+    return base_url, chat_model_id, memory_model_id
 
+def _build_agent(api_key: str, base_url: str, chat_model_id: str, turn_context: str, bio_tools: Optional[Toolkit] = None) -> Agent:
     # Temperature and Model Config
     chat_model = OpenAILike(
         id=chat_model_id, 
         base_url=base_url, 
         api_key=api_key,
-        temperature=0.5
+        temperature=0.5,
+        http_client=get_http_client()
     )
     
-    memory_model = OpenAILike(
-        id=memory_model_id, 
-        base_url=base_url, 
-        api_key=api_key,
-        temperature=0.1
-    )
-
-    persona = PERSONA_TEXT
     tools = [web_search, scrape_website]
     if bio_tools:
         tools.append(bio_tools)
 
-    storage = None
-    if PgAgentStorage and POSTGRES_URL:
-        try:
-            db_url = POSTGRES_URL
-            if "postgresql+asyncpg" in db_url:
-                db_url = db_url.replace("postgresql+asyncpg", "postgresql")
-            storage = PgAgentStorage(table_name="hero_memories", db_url=db_url)
-        except Exception:
-            storage = None
-
     agent_kwargs = {
         "model": chat_model,
         "num_history_messages": 0,
-        "memory_manager": MemoryManager(model=memory_model),
         "tools": tools,
-        "instructions": f"{persona}\n\nTime: {datetime.now(pytz.timezone(TZ)).strftime('%Y-%m-%d %H:%M:%S %Z')}\n\nContext:\n{history_str}",
+        "instructions": stable_instructions(),
+        "additional_context": turn_context,
+        "cache_session": True,
         "markdown": True
     }
 
-    if storage:
-        agent_kwargs["storage"] = storage
-
+    # No per-agent db: the session is only cached on the agent and persisted through the
+    # shared `agent_storage` backend after the run, off the event loop. No MemoryManager either: memory
+    # extraction runs in the background `memory_worker` after the reply is sent.
     return Agent(**agent_kwargs)
+
+def create_hero_agent(api_key: str, history_str: str, model_id: str = None, is_openrouter: bool = False, bio_tools: Optional[Toolkit] = None):
+    """
+    Creates the Hero Agent with fixed Model ID handling for OpenRouter.
+    Builds everything from scratch; the chat path uses `agent_pool` instead.
+    """
+    base_url, chat_model_id, _ = _resolve_model_ids(model_id, is_openrouter)
+    return _build_agent(api_key, base_url, chat_model_id, build_turn_context(history_str), bio_tools)
+
+# --- AGENT POOL ---
+class AgentPool:
+    """
+    Keeps prebuilt agents (and their models) keyed by (api key, model id, provider).
+    An agent is checked out by exactly one turn at a time, so concurrent turns on the
+    same key simply get different agents; only the per-turn context suffix is swapped in.
+    """
+    def __init__(self, max_idle: int = AGENT_POOL_SIZE):
+        self.max_idle = max_idle
+        self._idle: Dict[tuple, List[Agent]] = {}
+        self.built = 0
+        self.reused = 0
+
+    @asynccontextmanager
+    async def acquire(self, api_key: str, history_str: str, model_id: str = None, is_openrouter: bool = False, bio_tools: Optional[Toolkit] = None, user_id: Optional[str] = None, user_memories: Optional[List[str]] = None):
+        base_url, chat_model_id, _ = _resolve_model_ids(model_id, is_openrouter)
+        provider = "openrouter" if is_openrouter else "groq"
+        pool_key = (api_key, chat_model_id, provider, id(bio_tools))
+        idle = self._idle.setdefault(pool_key, [])
+
+        with span("agent_setup"):
+            turn_context = build_turn_context(history_str, user_memories)
+            if idle:
+                agent = idle.pop()
+                agent.additional_context = turn_context
+                self.reused += 1
+            else:
+                agent = _build_agent(api_key, base_url, chat_model_id, turn_context, bio_tools)
+                self.built += 1
+
+            # Every turn starts a fresh session, exactly like a newly built agent would;
+            # a new session_id also means agno will not reuse the previous turn's session
+            agent.session_id = str(uuid4())
+            agent.session_state = None
+        try:
+            yield agent
+            agent_storage.save_agent_session(agent, user_id=user_id)
+        finally:
+            # agno keeps `stream` sticky after a streamed run; clear it before reuse
+            agent.stream = None
+            if len(idle) < self.max_idle:
+                idle.append(agent)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "built": self.built,
+            "reused": self.reused,
+            "idle": sum(len(v) for v in self._idle.values()),
+        }
+
+agent_pool = AgentPool()
@@ -0,0 +1,102 @@
+import asyncio, logging, time
+from typing import Optional, Dict
+from core.config import POSTGRES_URL
+
+# --- SAFE IMPORT FOR STORAGE ---
+try:
+    from agno.db.postgres import PostgresDb
+except ImportError:
+    PostgresDb = None
+
+logger = logging.getLogger("AgentStorage")
+
+class _Timing:
+    """Count / total / max / last duration of one kind of storage call, in ms."""
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+
+    def observe(self, ms: float):
+        self.count += 1
+        self.total_ms += ms
+        self.last_ms = ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def as_dict(self) -> Dict[str, float]:
+        avg = self.total_ms / self.count if self.count else 0.0
+        return {"count": self.count, "errors": self.errors, "avg_ms": round(avg, 2),
+                "max_ms": round(self.max_ms, 2), "last_ms": round(self.last_ms, 2)}
+
+class AgentStorageBackend:
+    """
+    One process-wide PostgresDb (so one SQLAlchemy engine and pool) shared by every agent.
+    agno's sync db API runs in worker threads, so no storage call ever blocks the event
+    loop that serves the Discord gateway; agents themselves run without a `db`.
+    """
+    def __init__(self, table_name: str = "hero_memories"):
+        self.table_name = table_name
+        self.storage = None
+        self._pending: set = set()
+        self.writes = _Timing()
+
+    def _connect(self):
+        db_url = POSTGRES_URL
+        if "postgresql+asyncpg" in db_url:
+            db_url = db_url.replace("postgresql+asyncpg", "postgresql")
+        storage = PostgresDb(db_url=db_url, session_table=self.table_name)
+        storage.table_exists(self.table_name)  # opens the engine's first connection here
+        return storage
+
+    async def init(self):
+        """Builds the engine off the event loop (startup); sessions are not saved before this."""
+        if self.storage or not (PostgresDb and POSTGRES_URL): return
+        try:
+            self.storage = await asyncio.to_thread(self._connect)
+        except Exception as e:
+            logger.error(f"Agent storage init failed: {e}")
+
+    async def _timed(self, timing: _Timing, fn, *args):
+        start = time.perf_counter()
+        try:
+            return await asyncio.to_thread(fn, *args)
+        except Exception as e:
+            timing.errors += 1
+            logger.error(f"Agent storage call failed: {e}")
+            return None
+        finally:
+            timing.observe((time.perf_counter() - start) * 1000)
+
+    async def write_session(self, session):
+        if not self.storage or session is None: return None
+        return await self._timed(self.writes, self.storage.upsert_session, session)
+
+    def save_agent_session(self, agent, user_id: Optional[str] = None):
+        """
+        Snapshots the agent's finished session on the loop (cheap) and upserts it in the
+        background, so the reply never waits on Postgres.
+        """
+        if not self.storage or not agent.session_id: return
+        try:
+            # Agents cache their session (cache_session=True); None when no run happened this turn
+            session = agent.get_session()
+        except Exception as e:
+            logger.error(f"Could not snapshot agent session: {e}")
+            return
+        if session is None: return
+        session.user_id = session.user_id or user_id
+        task = asyncio.create_task(self.write_session(session))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def drain(self):
+        """Waits for in-flight background writes (used on shutdown)."""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, object]:
+        return {"writes": self.writes.as_dict(), "pending_writes": len(self._pending)}
+
+agent_storage = AgentStorageBackend()
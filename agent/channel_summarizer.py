@@ -0,0 +1,141 @@
+import asyncio, logging, time
+from collections import deque
+from typing import Dict, List, Optional
+from agno.agent import Agent
+from agno.models.openai import OpenAILike
+from core.config import *
+from core.http_client import get_http_client
+from core.cache import TTLCache
+from core.database import db_manager
+from agent.context_budget import truncate_to_budget
+
+logger = logging.getLogger("ChannelSummarizer")
+
+SUMMARY_PROMPT = f"""You keep a running summary of one Discord channel's conversation.
+You get the current summary and the messages that came after it. Return the updated summary:
+who is involved, topics, decisions, open questions, running jokes. Keep what still matters
+from the old summary and drop what no longer does. At most {SUMMARY_MAX_TOKENS * 3 // 4} words.
+Reply with the summary only."""
+
+class ChannelSummarizer:
+    """
+    Keeps a rolling summary in `channel_summaries` for each channel the bot has taken a
+    turn in within SUMMARY_ACTIVE_TTL; other channels are never sent to the LLM. Each update folds
+    the messages since the last one into the previous summary (never re-reading the
+    whole channel) and always leaves the newest SUMMARY_RAW_TAIL messages out, since the
+    context builder sends those verbatim. Updates start once SUMMARY_BATCH_SIZE messages
+    beyond that tail have piled up and run on the memory key with their own limits.
+    """
+    def __init__(self):
+        # Active channels -> [messages seen since the last update]; expires SUMMARY_ACTIVE_TTL
+        # after the bot's last turn there (the count is mutated in place, so it keeps that expiry)
+        self._active = TTLCache(CONTEXT_CACHE_CHANNELS, SUMMARY_ACTIVE_TTL)
+        self._running: Dict[int, asyncio.Task] = {}
+        self._slots = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+        self._calls = deque()  # call timestamps within the last minute
+        self._agents: List[Agent] = []
+        self._summaries = TTLCache(CONTEXT_CACHE_CHANNELS, CONTEXT_CACHE_IDLE)  # channel -> row, or False for none
+        self.updates = 0
+        self.summarized_messages = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return SUMMARY_ENABLED and bool(MEMORY_API_KEY)
+
+    async def get(self, channel_id: int) -> Optional[Dict]:
+        """The channel's summary row ({summary, last_message_id}), cached; None when there is none."""
+        if not self.enabled: return None
+        row = self._summaries.get(channel_id)
+        if row is None:
+            row = await db_manager.get_channel_summary(channel_id) or False
+            self._summaries.set(channel_id, row)
+        return row or None
+
+    def activate(self, channel_id: int):
+        """The bot took a turn in this channel: summarize it for the next SUMMARY_ACTIVE_TTL."""
+        if not self.enabled: return
+        self._active.set(channel_id, self._active.get(channel_id) or [0])
+
+    def observe(self, channel_id: int):
+        """Counts a new message in an active channel; schedules an update once enough piled up."""
+        if not self.enabled: return
+        count = self._active.get(channel_id)
+        if count is None: return
+        count[0] += 1
+        if count[0] >= SUMMARY_RAW_TAIL + SUMMARY_BATCH_SIZE and channel_id not in self._running:
+            task = asyncio.create_task(self._update(channel_id))
+            self._running[channel_id] = task
+            task.add_done_callback(lambda _: self._running.pop(channel_id, None))
+
+    async def _rate_limit(self):
+        while True:
+            now = time.monotonic()
+            while self._calls and now - self._calls[0] > 60:
+                self._calls.popleft()
+            if len(self._calls) < SUMMARY_CALLS_PER_MINUTE:
+                self._calls.append(now)
+                return
+            await asyncio.sleep(60 - (now - self._calls[0]))
+
+    def _summarizer(self) -> Agent:
+        if self._agents:
+            return self._agents.pop()
+        model = OpenAILike(
+            id=GROQ_MEMORY_MODEL,
+            base_url=GROQ_BASE_URL,
+            api_key=MEMORY_API_KEY,
+            temperature=0.2,
+            http_client=get_http_client()
+        )
+        return Agent(model=model, instructions=SUMMARY_PROMPT, markdown=False)
+
+    async def _update(self, channel_id: int):
+        async with self._slots:
+            try:
+                current = await db_manager.get_channel_summary(channel_id)
+                summary = current['summary'] if current else ""
+                after = current['last_message_id'] if current else 0
+                if current is None:
+                    # A new summary starts from recent history, not the channel's whole past
+                    recent = await db_manager.get_messages(channel_id, limit=SUMMARY_MAX_BATCH + SUMMARY_RAW_TAIL)
+                    after = recent[0]['message_id'] - 1 if recent else 0
+                while True:
+                    rows = await db_manager.get_channel_messages_after(channel_id, after, SUMMARY_MAX_BATCH + SUMMARY_RAW_TAIL)
+                    batch = rows[:-SUMMARY_RAW_TAIL] if SUMMARY_RAW_TAIL else rows
+                    if len(batch) < SUMMARY_BATCH_SIZE: break
+                    await self._rate_limit()
+                    summary = await self._fold(summary, batch)
+                    after = batch[-1]['message_id']
+                    await db_manager.set_channel_summary(channel_id, summary, after)
+                    self._summaries.set(channel_id, {"summary": summary, "last_message_id": after})
+                    count = self._active.get(channel_id)
+                    if count:
+                        count[0] = max(0, count[0] - len(batch))
+                    self.updates += 1
+                    self.summarized_messages += len(batch)
+                    if len(rows) < SUMMARY_MAX_BATCH + SUMMARY_RAW_TAIL: break  # backlog done
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Summary update failed for {channel_id}: {e}")
+
+    async def _fold(self, summary: str, batch: List[Dict]) -> str:
+        lines = "\n".join(f"{m['author_name']}: {m['content']}" for m in batch)
+        agent = self._summarizer()
+        try:
+            response = await agent.arun(f"Current summary:\n{summary or '(none yet)'}\n\nNew messages:\n{lines}")
+        finally:
+            self._agents.append(agent)
+        text = (response.content if response else "") or ""
+        if not text.strip(): raise ValueError("empty summary")
+        return truncate_to_budget(text.strip(), SUMMARY_MAX_TOKENS)
+
+    async def drain(self):
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+    def stats(self) -> Dict[str, object]:
+        return {"updates": self.updates, "summarized_messages": self.summarized_messages, "errors": self.errors,
+                "in_flight": len(self._running), "active_channels": len(self._active), "cache": self._summaries.stats()}
+
+channel_summarizer = ChannelSummarizer()
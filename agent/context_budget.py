@@ -0,0 +1,66 @@
+import logging
+from functools import lru_cache
+from typing import Dict, Optional
+from core.config import TOKEN_CHARS_PER_TOKEN
+
+# Optional exact tokenizer; the char heuristic is close enough for budgeting
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+logger = logging.getLogger("ContextBudget")
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text: str) -> int:
+    """Token count for `text` (cached: the persona and history repeat every turn)."""
+    if not text: return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return int(len(text) / TOKEN_CHARS_PER_TOKEN) + 1
+
+def truncate_to_budget(text: str, budget: int, marker: str = "\n[...truncated]") -> str:
+    """Keeps the head of `text` within `budget` tokens (just the marker when nothing fits)."""
+    if not text or estimate_tokens(text) <= budget: return text
+    if budget <= 0: return marker
+    if _ENCODING is not None:
+        return _ENCODING.decode(_ENCODING.encode(text, disallowed_special=())[:budget]) + marker
+    return text[:int(budget * TOKEN_CHARS_PER_TOKEN)] + marker
+
+def keep_recent_lines(text: str, budget: int) -> str:
+    """
+    Keeps the newest lines of a chronological log within `budget` tokens; older lines
+    are dropped first since the last messages matter most for the reply.
+    """
+    if not text or estimate_tokens(text) <= budget: return text
+    kept, used = [], 0
+    for line in reversed(text.split("\n")):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            if not kept:
+                kept.append(truncate_to_budget(line, budget, marker=""))
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(reversed(kept))
+
+def fit_tool_output(text: str, budget: int, keep: str = "head") -> str:
+    """Bounds a tool result before it goes back into the model's context."""
+    return keep_recent_lines(text, budget) if keep == "tail" else truncate_to_budget(text, budget)
+
+def reported_input_tokens(response) -> Optional[int]:
+    """Provider-reported prompt tokens from an agno run response, when present."""
+    metrics = getattr(response, "metrics", None)
+    if isinstance(metrics, dict):
+        value = metrics.get("input_tokens") or metrics.get("prompt_tokens")
+    else:
+        value = getattr(metrics, "input_tokens", None)
+    if isinstance(value, list):
+        value = sum(v for v in value if v)
+    return value or None
+
+def log_turn_tokens(sections: Dict[str, str], response=None):
+    counts = {name: estimate_tokens(text or "") for name, text in sections.items()}
+    reported = reported_input_tokens(response) if response is not None else None
+    logger.info(f"Turn tokens: {counts} total~{sum(counts.values())} reported_input={reported}")
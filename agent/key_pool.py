@@ -0,0 +1,205 @@
+import os, re, time, asyncio, logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from core.config import *
+
+logger = logging.getLogger("KeyPool")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+RATE_LIMIT_MARKERS = ["rate limit", "429", "quota exceeded"]
+
+def looks_rate_limited(text: str) -> bool:
+    """Providers sometimes answer a throttled request with an error message as content."""
+    text = (text or "").lower()
+    return any(x in text for x in RATE_LIMIT_MARKERS)
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parses `Retry-After` style seconds or Groq style `2m59.5s` resets."""
+    if not value: return None
+    try:
+        return float(value)
+    except ValueError:
+        parts = _DURATION_PART.findall(value)
+        return sum(float(n) * _UNIT_SECONDS[u] for n, u in parts) if parts else None
+
+def _response_headers(exc: BaseException) -> Dict[str, str]:
+    """agno wraps the OpenAI SDK error; the HTTP response hangs off the original cause."""
+    seen = 0
+    while exc is not None and seen < 5:
+        response = getattr(exc, "response", None)
+        if response is not None and getattr(response, "headers", None) is not None:
+            return {k.lower(): v for k, v in response.headers.items()}
+        exc = exc.__cause__ or exc.__context__
+        seen += 1
+    return {}
+
+class KeyState:
+    """Health of one API key: latency window, error rate and circuit-breaker state."""
+    def __init__(self, name: str, key: str, is_openrouter: bool, rank: int):
+        self.name = name
+        self.key = key
+        self.is_openrouter = is_openrouter
+        self.rank = rank
+        self.latencies = deque(maxlen=KEY_LATENCY_WINDOW)
+        self.error_rate = 0.0  # EWMA of failures (0..1)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.open_for = KEY_OPEN_SECONDS
+        self.probe_in_flight = False
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies: return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def available(self, now: float) -> bool:
+        if self.state == OPEN and now >= self.open_until:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            return not self.probe_in_flight
+        return self.state == CLOSED
+
+    def score(self) -> float:
+        """Expected cost of using this key; lower is better."""
+        latency = self.percentile(0.5) or KEY_DEFAULT_LATENCY
+        return latency * (1 + 4 * self.error_rate)
+
+    def as_dict(self) -> Dict[str, object]:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {"state": self.state, "successes": self.successes, "failures": self.failures,
+                "error_rate": round(self.error_rate, 3),
+                "p50_s": round(p50, 3) if p50 else None, "p95_s": round(p95, 3) if p95 else None}
+
+class KeyPool:
+    """
+    Picks API keys by observed health instead of fixed order. Keys that fail repeatedly,
+    or report a rate limit, are taken out by a circuit breaker and come back through a
+    single half-open probe. Optionally hedges a slow request onto the next key.
+    """
+    def __init__(self, keys: List[KeyState]):
+        self.keys = keys
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @classmethod
+    def from_env(cls) -> "KeyPool":
+        entries = [
+            (os.getenv("GROQ_API_KEY_1"), False, "Groq-1"),
+            (os.getenv("GROQ_API_KEY_2"), False, "Groq-2"),
+            (os.getenv("OPENROUTER_API_KEY"), True, "OpenRouter")
+        ]
+        return cls([KeyState(name, key, is_or, i) for i, (key, is_or, name) in enumerate(entries) if key])
+
+    def endpoints(self) -> List[Tuple[str, str, str]]:
+        """(name, base_url, api_key) per configured key, e.g. for connection warm-up."""
+        return [(k.name, OPENROUTER_BASE_URL if k.is_openrouter else GROQ_BASE_URL, k.key) for k in self.keys]
+
+    def candidates(self) -> List[KeyState]:
+        """Usable keys, healthiest first (configured order breaks ties)."""
+        now = time.monotonic()
+        usable = [k for k in self.keys if k.available(now)]
+        return sorted(usable, key=lambda k: (k.score(), k.rank))
+
+    def begin(self, state: KeyState):
+        if state.state == HALF_OPEN:
+            state.probe_in_flight = True
+
+    def release(self, state: KeyState):
+        """The attempt ended without a verdict (e.g. cancelled by a hedge)."""
+        state.probe_in_flight = False
+
+    def record_success(self, state: KeyState, latency: float):
+        state.latencies.append(latency)
+        state.successes += 1
+        state.consecutive_failures = 0
+        state.error_rate *= (1 - KEY_ERROR_DECAY)
+        state.probe_in_flight = False
+        if state.state != CLOSED:
+            logger.info(f"Key {state.name} recovered, closing circuit.")
+        state.state = CLOSED
+        state.open_for = KEY_OPEN_SECONDS
+
+    def record_failure(self, state: KeyState, error: Optional[BaseException] = None, rate_limited: bool = False):
+        state.failures += 1
+        state.consecutive_failures += 1
+        state.error_rate = state.error_rate * (1 - KEY_ERROR_DECAY) + KEY_ERROR_DECAY
+        state.probe_in_flight = False
+
+        headers = _response_headers(error) if error else {}
+        status = getattr(error, "status_code", None)
+        rate_limited = rate_limited or status == 429 or headers.get("x-ratelimit-remaining-requests") == "0"
+        retry_after = _parse_duration(headers.get("retry-after", "")) or \
+            _parse_duration(headers.get("x-ratelimit-reset-requests", ""))
+
+        if rate_limited:
+            self._open(state, retry_after or KEY_COOLDOWN, reason="rate limited")
+        elif state.state == HALF_OPEN or state.consecutive_failures >= KEY_FAILURE_THRESHOLD:
+            self._open(state, state.open_for, reason=f"{state.consecutive_failures} consecutive failures")
+            state.open_for = min(state.open_for * 2, KEY_COOLDOWN)
+
+    def _open(self, state: KeyState, seconds: float, reason: str):
+        seconds = min(seconds, KEY_COOLDOWN)
+        state.state = OPEN
+        state.open_until = time.monotonic() + seconds
+        logger.warning(f"Key {state.name} {reason}; circuit open for {seconds:.0f}s.")
+
+    def hedge_delay(self, state: KeyState) -> Optional[float]:
+        """When to start a backup request: the primary's p95 model time, once there is enough data."""
+        if not KEY_HEDGE_ENABLED or len(state.latencies) < KEY_HEDGE_MIN_SAMPLES: return None
+        return max(state.percentile(0.95), KEY_HEDGE_MIN_DELAY)
+
+    async def run_hedged(self, candidates: List[KeyState], attempt: Callable[[KeyState], Awaitable[Optional[object]]],
+                         may_hedge: Optional[Callable[[KeyState], bool]] = None):
+        """
+        Runs `attempt` on the best key and, if it is still running after its p95, on the
+        next one too; the first non-None result wins and the other attempt is cancelled.
+        Failed attempts fall through to the next candidate immediately. `may_hedge(primary)`
+        returning False (e.g. it is already running tools) skips the backup request.
+        """
+        remaining = list(candidates)
+        running: Dict[asyncio.Task, KeyState] = {}
+        primary = remaining.pop(0)
+        running[asyncio.create_task(attempt(primary))] = primary
+        delay = self.hedge_delay(primary)
+        try:
+            while running:
+                timeout = delay if remaining and len(running) == 1 else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done and may_hedge and not may_hedge(primary):
+                    # A backup would repeat the primary's tool calls; wait for it instead
+                    delay = None
+                    continue
+                if not done:
+                    backup = remaining.pop(0)
+                    self.hedges += 1
+                    logger.info(f"Hedging {primary.name} -> {backup.name} after {delay:.2f}s")
+                    running[asyncio.create_task(attempt(backup))] = backup
+                    continue
+                for task in done:
+                    state = running.pop(task)
+                    result = None if task.cancelled() or task.exception() else task.result()
+                    if result is not None:
+                        if state is not primary:
+                            self.hedge_wins += 1
+                        return result
+                if not running and remaining:
+                    nxt = remaining.pop(0)
+                    running[asyncio.create_task(attempt(nxt))] = nxt
+            return None
+        finally:
+            for task, state in running.items():
+                task.cancel()
+                self.release(state)
+
+    def stats(self) -> Dict[str, object]:
+        return {"keys": {k.name: k.as_dict() for k in self.keys},
+                "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+
+key_pool = KeyPool.from_env()
@@ -0,0 +1,146 @@
+import asyncio, logging, time
+from collections import deque
+from typing import Dict, List, Tuple
+from agno.agent import Agent
+from agno.models.openai import OpenAILike
+from core.config import *
+from core.http_client import get_http_client
+from core.cache import TTLCache
+from core.database import db_manager
+
+logger = logging.getLogger("MemoryWorker")
+
+EXTRACTION_PROMPT = """You maintain long-term memories about one Discord user.
+Read the chat turns and list NEW durable facts about the user: identity, preferences, relationships, plans, recurring jokes.
+Skip small talk and anything already known. One fact per line, each starting with "- ". Reply NONE if there is nothing new."""
+
+class MemoryWorker:
+    """
+    Extracts user memories in the background instead of inside `agent.arun`.
+    Finished turns are queued per user and debounced (MEMORY_DEBOUNCE of quiet, or
+    MEMORY_BATCH_SIZE turns) into one extraction call. Calls run on MEMORY_API_KEY,
+    at most MEMORY_CONCURRENCY at once and MEMORY_CALLS_PER_MINUTE overall.
+    Recall reads a per-user cache that is invalidated whenever new memories land.
+    """
+    def __init__(self):
+        self._pending: Dict[str, List[Tuple[str, str]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set = set()
+        self._slots = asyncio.Semaphore(MEMORY_CONCURRENCY)
+        self._calls = deque()  # call timestamps within the last minute
+        self._agents: List[Agent] = []
+        self._recall_cache = TTLCache(maxsize=1000, ttl=600)
+        self.processed_turns = 0
+        self.extracted = 0
+        self.errors = 0
+
+    # --- RECALL (critical path: cache first) ---
+
+    async def recall(self, user_id: str) -> List[str]:
+        memories = self._recall_cache.get(user_id)
+        if memories is None:
+            memories = await db_manager.get_user_memories(int(user_id), limit=MEMORY_RECALL_LIMIT)
+            self._recall_cache.set(user_id, memories)
+        return memories
+
+    # --- INGEST (after the reply is sent) ---
+
+    def submit(self, user_id: str, prompt: str, reply: str):
+        if not (MEMORY_ENABLED and MEMORY_API_KEY) or not prompt: return
+        batch = self._pending.setdefault(user_id, [])
+        batch.append((prompt, reply or ""))
+        timer = self._timers.pop(user_id, None)
+        if timer:
+            timer.cancel()
+        if len(batch) >= MEMORY_BATCH_SIZE:
+            self._schedule(user_id)
+        else:
+            loop = asyncio.get_running_loop()
+            self._timers[user_id] = loop.call_later(MEMORY_DEBOUNCE, self._schedule, user_id)
+
+    def submit_burst(self, prompts: List[Tuple[str, str]], reply: str):
+        """A turn merged from several messages: each author's (user_id, prompt) lines are queued under their own user."""
+        by_user: Dict[str, List[str]] = {}
+        for user_id, prompt in prompts:
+            if prompt:
+                by_user.setdefault(user_id, []).append(prompt)
+        for user_id, lines in by_user.items():
+            self.submit(user_id, "\n".join(lines), reply)
+
+    def _schedule(self, user_id: str):
+        self._timers.pop(user_id, None)
+        batch = self._pending.pop(user_id, None)
+        if not batch: return
+        task = asyncio.create_task(self._process(user_id, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _rate_limit(self):
+        while True:
+            now = time.monotonic()
+            while self._calls and now - self._calls[0] > 60:
+                self._calls.popleft()
+            if len(self._calls) < MEMORY_CALLS_PER_MINUTE:
+                self._calls.append(now)
+                return
+            await asyncio.sleep(60 - (now - self._calls[0]))
+
+    def _extractor(self) -> Agent:
+        if self._agents:
+            return self._agents.pop()
+        model = OpenAILike(
+            id=GROQ_MEMORY_MODEL,
+            base_url=GROQ_BASE_URL,
+            api_key=MEMORY_API_KEY,
+            temperature=0.1,
+            http_client=get_http_client()
+        )
+        return Agent(model=model, instructions=EXTRACTION_PROMPT, markdown=False)
+
+    async def _process(self, user_id: str, batch: List[Tuple[str, str]]):
+        async with self._slots:
+            await self._rate_limit()
+            known = await db_manager.get_user_memories(int(user_id), limit=MEMORY_MAX_PER_USER)
+            turns = "\n".join(f"User: {p}\nHero: {r}" for p, r in batch)
+            known_text = "\n".join(f"- {m}" for m in known) or "(nothing yet)"
+            agent = self._extractor()
+            try:
+                response = await agent.arun(f"Already known:\n{known_text}\n\nChat turns:\n{turns}")
+                facts = self._parse(response.content if response else "", known)
+                if facts:
+                    await db_manager.add_user_memories(int(user_id), facts, keep=MEMORY_MAX_PER_USER)
+                    self._recall_cache.pop(user_id)
+                self.processed_turns += len(batch)
+                self.extracted += len(facts)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Memory extraction failed for {user_id}: {e}")
+            finally:
+                self._agents.append(agent)
+
+    @staticmethod
+    def _parse(text: str, known: List[str]) -> List[str]:
+        seen = {m.strip().lower() for m in known}
+        facts = []
+        for line in (text or "").splitlines():
+            line = line.strip()
+            if not line.startswith("- "): continue
+            fact = line[2:].strip()
+            if fact and fact.lower() not in seen:
+                seen.add(fact.lower())
+                facts.append(fact)
+        return facts
+
+    async def drain(self):
+        """Processes everything still debouncing (used on shutdown)."""
+        for user_id in list(self._pending):
+            self._schedule(user_id)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, object]:
+        return {"pending_users": len(self._pending), "in_flight": len(self._tasks),
+                "processed_turns": self.processed_turns, "extracted": self.extracted,
+                "errors": self.errors, "recall_cache": self._recall_cache.stats()}
+
+memory_worker = MemoryWorker()
@@ -0,0 +1,101 @@
+import re, json, time, logging
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional, Tuple
+from core.config import *
+from core.metrics import registry
+
+logger = logging.getLogger("ModelRouter")
+
+SMALL, LARGE, VISION = "small", "large", "vision"
+
+# Cues that a turn will want tools (web, history, profiles) or real reasoning
+_TOOL_HINTS = re.compile(
+    r"https?://|\b(search|google|look ?up|latest|news|today|price|weather|scrape|read this|link|"
+    r"what happened|did (i|he|she|they)|remember|recall|history|profile|avatar|pfp|roast|judge|"
+    r"who is|explain|why|how (do|does|to|can)|compare|code|write|summari[sz]e|translate|calculate)\b",
+    re.IGNORECASE
+)
+
+@dataclass
+class Route:
+    tier: str
+    reason: str
+    features: Dict[str, object] = field(default_factory=dict)
+
+class ModelRouter:
+    """
+    Picks a model tier per turn from cheap features: attached images go to the vision
+    model, short chit-chat with no tool cues to the small model, everything else to the
+    large one. When the large model's observed p95 crosses ROUTER_DEGRADE_P95 the router
+    degrades long turns to the small model until it recovers; turns that want tools stay
+    on the large model. Each decision is logged with its
+    features and outcome so the thresholds can be tuned.
+    """
+    def __init__(self):
+        self.latencies: Dict[str, Deque[Tuple[float, float]]] = {}  # model -> (monotonic time, seconds)
+        self.decisions = Counter()
+        self.escalations = 0
+        self.llm_seconds = registry.histogram("hero_route_llm_seconds", "LLM latency by routed tier and model")
+
+    def classify(self, prompt: str, has_images: bool) -> Route:
+        text = prompt or ""
+        features = {"chars": len(text), "words": len(text.split()), "images": has_images,
+                    "tool_hint": bool(_TOOL_HINTS.search(text)), "question": "?" in text}
+        if has_images:
+            return Route(VISION, "images", features)
+        if not ROUTER_ENABLED:
+            return Route(LARGE, "router_disabled", features)
+        if features["tool_hint"]:
+            tier, reason = LARGE, "tool_hint"
+        elif features["chars"] > ROUTER_SMALL_MAX_CHARS or "```" in text:
+            tier, reason = LARGE, "long"
+        else:
+            tier, reason = SMALL, "trivial"
+        if tier == LARGE and reason != "tool_hint":
+            # Tool-using turns are not degraded: the small model handles tools poorly.
+            # Degrade only while every large model with fresh samples is slow; samples age
+            # out, so the large model is tried again once the window has gone quiet
+            observed = [p for p in (self.percentile(m, 0.95) for m in (GROQ_MODEL, OPENROUTER_MODEL)) if p is not None]
+            features["large_p95_s"] = round(min(observed), 3) if observed else None
+            if observed and min(observed) > ROUTER_DEGRADE_P95:
+                tier, reason = SMALL, "degraded"
+        return Route(tier, reason, features)
+
+    def escalate(self, route: Route) -> Optional[Route]:
+        """The next tier up after the small model failed on every key."""
+        if route.tier != SMALL: return None
+        self.escalations += 1
+        return Route(LARGE, f"escalated_from_{route.reason}", route.features)
+
+    @staticmethod
+    def model_for(route: Route, is_openrouter: bool) -> str:
+        if route.tier == VISION:
+            return GROQ_VISION_MODEL
+        if route.tier == SMALL:
+            return OPENROUTER_SMALL_MODEL if is_openrouter else GROQ_SMALL_MODEL
+        return OPENROUTER_MODEL if is_openrouter else GROQ_MODEL
+
+    def percentile(self, model_id: str, q: float) -> Optional[float]:
+        cutoff = time.monotonic() - ROUTER_LATENCY_MAX_AGE
+        fresh = [latency for at, latency in self.latencies.get(model_id, ()) if at >= cutoff]
+        if len(fresh) < ROUTER_MIN_SAMPLES: return None
+        ordered = sorted(fresh)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def record(self, route: Route, model_id: str, latency: Optional[float], ok: bool):
+        """One attempt's outcome; latency (model time, tool calls excluded) feeds the degrade decision and the tuning log."""
+        self.decisions[f"{route.tier}_{route.reason}_{'ok' if ok else 'failed'}"] += 1
+        if ok and latency is not None:
+            self.latencies.setdefault(model_id, deque(maxlen=ROUTER_LATENCY_WINDOW)).append((time.monotonic(), latency))
+            self.llm_seconds.observe(latency, tier=route.tier, model=model_id)
+        logger.info("Route " + json.dumps({"tier": route.tier, "reason": route.reason, "model": model_id, "ok": ok,
+                                           "latency_s": round(latency, 3) if latency is not None else None,
+                                           **route.features}))
+
+    def stats(self) -> Dict[str, object]:
+        p95 = {m: self.percentile(m, 0.95) for m in self.latencies}
+        return {"decisions": dict(self.decisions), "escalations": self.escalations,
+                "p95_s": {m: round(v, 3) for m, v in p95.items() if v is not None}}
+
+model_router = ModelRouter()
@@ -0,0 +1,77 @@
+import pytz
+from datetime import datetime
+from typing import Dict, List, Optional
+from agno.metrics import RunMetrics
+from core.config import PERSONA_TEXT, TZ, HISTORY_TOKEN_BUDGET, PROMPT_TIME_GRANULARITY
+from agent.context_budget import keep_recent_lines
+
+# Prompt layout (provider prefix caches match on the longest identical prefix):
+#   system = persona (+ agno's static markdown note)      <- byte-stable, set once per agent
+#            + additional_context: time bucket, history   <- variable suffix, swapped per turn
+#   user   = the current prompt
+# Tool schemas are sent in a fixed order alongside, so they never perturb the prefix either.
+
+def stable_instructions() -> str:
+    """The static part of the system prompt; identical bytes on every turn."""
+    return PERSONA_TEXT
+
+def current_time_bucket() -> str:
+    """Current time rounded down to PROMPT_TIME_GRANULARITY minutes."""
+    now = datetime.now(pytz.timezone(TZ))
+    now = now.replace(minute=now.minute - now.minute % PROMPT_TIME_GRANULARITY, second=0, microsecond=0)
+    return now.strftime('%Y-%m-%d %H:%M %Z')
+
+def build_turn_context(history_str: str, user_memories: Optional[List[str]] = None) -> str:
+    """Variable suffix of the system prompt: coarse time, what we remember about the user, history."""
+    history_str = keep_recent_lines(history_str, HISTORY_TOKEN_BUDGET)
+    memories = ""
+    if user_memories:
+        memories = "What you remember about this user:\n" + "\n".join(f"- {m}" for m in user_memories) + "\n\n"
+    return f"Time: {current_time_bucket()}\n\n{memories}Context:\n{history_str}"
+
+# agno reports prompt-cache reads as `cache_read_tokens`; older builds used `cached_tokens`
+_CACHED_FIELDS = ("cache_read_tokens", "cached_tokens")
+
+def _has_metric(metrics, name: str) -> bool:
+    return name in metrics if isinstance(metrics, dict) else hasattr(metrics, name)
+
+def _metric(metrics, *names: str) -> int:
+    """The first of `names` the metrics carry, as an int (0 when none is reported)."""
+    name = next((n for n in names if _has_metric(metrics, n)), None)
+    if name is None: return 0
+    value = metrics.get(name) if isinstance(metrics, dict) else getattr(metrics, name, None)
+    if isinstance(value, list):
+        value = sum(v for v in value if v)
+    return int(value or 0)
+
+class PrefixCacheStats:
+    """Prompt-cache hit counters, from the cached-token counts providers report in usage."""
+    def __init__(self):
+        self.turns = 0
+        self.reported = 0
+        self.hits = 0
+        self.cached_tokens = 0
+        self.input_tokens = 0
+
+    def observe(self, response):
+        """One finished run (the RunOutput, or the final output of a streamed run)."""
+        self.turns += 1
+        metrics = getattr(response, "metrics", None)
+        if not metrics: return
+        cached = _metric(metrics, *_CACHED_FIELDS)
+        self.input_tokens += _metric(metrics, "input_tokens")
+        # RunMetrics always carries the cache counter; a zero there is a real miss
+        if isinstance(metrics, RunMetrics) or any(_has_metric(metrics, n) for n in _CACHED_FIELDS):
+            self.reported += 1
+        if cached:
+            self.hits += 1
+            self.cached_tokens += cached
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "turns": self.turns, "reported": self.reported, "hits": self.hits,
+            "hit_rate": round(self.hits / self.reported, 3) if self.reported else 0.0,
+            "cached_token_ratio": round(self.cached_tokens / self.input_tokens, 3) if self.input_tokens else 0.0,
+        }
+
+prefix_cache_stats = PrefixCacheStats()
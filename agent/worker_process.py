@@ -0,0 +1,159 @@
+import os, asyncio, logging, resource, itertools
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from agno.media import Image
+from core.config import *
+from core.database import db_manager
+from core.execution_context import set_current_channel, set_current_query
+from core.http_client import close_http_client, warm_up
+from core.metrics import trace_turn, turn_seconds
+from agent.agent_factory import agent_pool
+from agent.agent_storage import agent_storage
+from agent.key_pool import key_pool
+from agent.model_router import model_router
+from tools.bio_tools import BioTools
+from tools.web_tools import tool_cache_stats
+from discord_bot.chat_handler import generate_reply
+
+logger = logging.getLogger("AgentWorker")
+
+class GatewayClient:
+    """Calls back into the gateway process for things only it has (Discord, the vector index)."""
+    def __init__(self, index: int, outbox):
+        self.index = index
+        self.outbox = outbox
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    async def call(self, method: str, *args) -> Any:
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[call_id] = future
+        self.outbox.put({"op": "rpc", "worker": self.index, "id": call_id, "method": method, "args": list(args)})
+        try:
+            return await asyncio.wait_for(future, timeout=WORKER_RPC_TIMEOUT)
+        finally:
+            self._pending.pop(call_id, None)
+
+    def resolve(self, msg: Dict[str, Any]):
+        future = self._pending.get(msg["id"])
+        if future is None or future.done(): return
+        if msg.get("error"):
+            future.set_exception(RuntimeError(msg["error"]))
+        else:
+            future.set_result(msg.get("result"))
+
+class RemoteUserLookup:
+    """UserLookup's interface, answered by the gateway's cached lookup."""
+    def __init__(self, gateway: GatewayClient):
+        self.gateway = gateway
+
+    async def get_user(self, user_id: int):
+        data = await self.gateway.call("get_user", user_id)
+        avatar = SimpleNamespace(url=data["avatar_url"])
+        return SimpleNamespace(id=data["id"], name=data["name"], display_name=data["display_name"],
+                               avatar=avatar, default_avatar=avatar)
+
+    async def get_member(self, guild, user_id: int):
+        data = await self.gateway.call("get_member", guild.id, user_id)
+        joined = datetime.fromisoformat(data["joined_at"]) if data.get("joined_at") else None
+        return SimpleNamespace(id=data["id"], joined_at=joined)
+
+    def stats(self) -> Dict[str, object]:
+        return {}
+
+class RemoteSemanticIndex:
+    def __init__(self, gateway: GatewayClient):
+        self.gateway = gateway
+
+    async def search(self, query: str, guild_id: Optional[int], channel_id: Optional[int] = None) -> List[int]:
+        return await self.gateway.call("semantic_search", query, guild_id, channel_id)
+
+class AgentWorker:
+    def __init__(self, index: int, inbox, outbox):
+        self.index = index
+        self.inbox = inbox
+        self.outbox = outbox
+        self.gateway = GatewayClient(index, outbox)
+        self.bio_tools = BioTools(None, lookup=RemoteUserLookup(self.gateway), semantic=RemoteSemanticIndex(self.gateway))
+        self.tasks: Dict[int, asyncio.Task] = {}  # turn id -> running turn
+        self.turns = 0
+        self.errors = 0
+
+    def send(self, msg: Dict[str, Any]):
+        self.outbox.put({**msg, "worker": self.index})
+
+    async def run_turn(self, turn_id: int, payload: Dict[str, Any]):
+        text = None
+        # Tools read the conversation scope from the execution context, as in the gateway
+        guild = SimpleNamespace(id=payload["guild_id"]) if payload.get("guild_id") else None
+        set_current_channel(SimpleNamespace(id=payload["channel_id"], guild=guild))
+        set_current_query(payload["prompt"])
+        images = [Image(**{k: v for k, v in i.items() if v is not None}) for i in payload.get("images") or []]
+        try:
+            with trace_turn(worker=self.index, channel_id=payload["channel_id"], message_id=payload["message_id"]):
+                result = await generate_reply(payload["prompt"], payload["history"], images, payload["user_id"],
+                                              payload.get("user_memories") or [], self.bio_tools)
+            text = result.content if result is not None else None
+        except Exception as e:
+            self.errors += 1
+            logger.exception(e)
+        finally:
+            self.turns += 1
+            self.send({"op": "reply", "id": turn_id, "text": text})
+
+    def stats(self) -> Dict[str, Any]:
+        series = [s for s in turn_seconds.series.values()]
+        return {
+            "pid": os.getpid(), "turns": self.turns, "errors": self.errors, "running": len(self.tasks),
+            "turn_seconds_sum": round(sum(s[-2] for s in series), 3), "turn_seconds_count": sum(s[-1] for s in series),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "keys": key_pool.stats(), "router": model_router.stats(), "agent_pool": agent_pool.stats(), "tool_cache": tool_cache_stats()
+        }
+
+    async def serve(self):
+        await db_manager.init(migrate=False)
+        await agent_storage.init()
+        if PROVIDER_WARMUP:
+            asyncio.create_task(warm_up(key_pool.endpoints()))
+        self.send({"op": "ready"})
+        loop = asyncio.get_running_loop()
+        reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="worker-inbox")
+        try:
+            while True:
+                msg = await loop.run_in_executor(reader, self.inbox.get)
+                op = msg.get("op")
+                if op == "turn":
+                    turn_id = msg["id"]
+                    task = asyncio.create_task(self.run_turn(turn_id, msg["payload"]))
+                    self.tasks[turn_id] = task
+                    task.add_done_callback(lambda _, t=turn_id: self.tasks.pop(t, None))
+                elif op == "cancel":
+                    # The gateway gave up on this turn; its reply (None) frees the slot there
+                    task = self.tasks.get(msg["id"])
+                    if task:
+                        task.cancel()
+                elif op == "rpc_result":
+                    self.gateway.resolve(msg)
+                elif op == "ping":
+                    self.send({"op": "pong", "stats": self.stats()})
+                elif op == "stop":
+                    break
+        finally:
+            if self.tasks:
+                await asyncio.wait(list(self.tasks.values()), timeout=WORKER_TURN_TIMEOUT)
+            await agent_storage.drain()
+            await db_manager.close()
+            await close_http_client()
+            reader.shutdown(wait=False)
+
+def worker_main(index: int, inbox, outbox):
+    """Entry point of an agent worker process."""
+    # Under spawn the bot's main module is re-imported first, so its JSON logging applies here too
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(AgentWorker(index, inbox, outbox).serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,41 @@
+"""
+Per-turn agent setup cost: rebuilding everything vs. checking out of `agent_pool`.
+No network is touched; only object construction is timed.
+
+    python benchmarks/bench_agent_setup.py [turns]
+"""
+import os, sys, time, asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.agent_factory import create_hero_agent, agent_pool
+
+HISTORY = "\n".join(f"User{i}: message number {i}" for i in range(15))
+KEYS = [("bench-key-1", False), ("bench-key-2", False), ("bench-key-3", True)]
+
+def bench_rebuild(turns: int) -> float:
+    start = time.perf_counter()
+    for i in range(turns):
+        key, is_or = KEYS[i % len(KEYS)]
+        create_hero_agent(key, HISTORY, is_openrouter=is_or)
+    return (time.perf_counter() - start) / turns
+
+async def bench_pool(turns: int) -> float:
+    # Warm the pool once per key, as the first real turns would
+    for key, is_or in KEYS:
+        async with agent_pool.acquire(key, HISTORY, is_openrouter=is_or):
+            pass
+    start = time.perf_counter()
+    for i in range(turns):
+        key, is_or = KEYS[i % len(KEYS)]
+        async with agent_pool.acquire(key, HISTORY, is_openrouter=is_or):
+            pass
+    return (time.perf_counter() - start) / turns
+
+if __name__ == "__main__":
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rebuild = bench_rebuild(turns)
+    pooled = asyncio.run(bench_pool(turns))
+    print(f"rebuild everything : {rebuild * 1e3:8.3f} ms/turn")
+    print(f"agent_pool.acquire : {pooled * 1e3:8.3f} ms/turn")
+    print(f"speedup            : {rebuild / pooled:8.1f}x  {agent_pool.stats()}")
@@ -0,0 +1,161 @@
+"""
+Offline end-to-end latency benchmark for handle_chat: a local fake LLM, fake Discord
+objects and (optionally) the Postgres at POSTGRES_URL. Reports turns by outcome and
+p50/p95/p99 per stage over the turns that replied; exits non-zero if any turn did not.
+
+    python benchmarks/bench_e2e.py --turns 200 --concurrency 8 --channels 4 [--stream] [--db]
+"""
+import os, sys, time, asyncio, argparse, contextvars
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_llm import FakeLLMServer
+from fake_discord import FakeBot, FakeChannel, FakeGuild, FakeMessage, FakeUser
+
+_turn: contextvars.ContextVar[Dict[str, float]] = contextvars.ContextVar("bench_turn")
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+def _add(stage: str, seconds: float):
+    timings = _turn.get(None)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+def instrument(chat_handler, agent_pool):
+    """Wraps the pipeline stages with timers keyed to the current benchmark turn."""
+    build_history = chat_handler.build_history_string
+
+    async def timed_history(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await build_history(*args, **kwargs)
+        finally:
+            _add("history", time.perf_counter() - start)
+    chat_handler.build_history_string = timed_history
+
+    acquire = agent_pool.acquire
+
+    @asynccontextmanager
+    async def timed_acquire(*args, **kwargs):
+        start = time.perf_counter()
+        async with acquire(*args, **kwargs) as agent:
+            entered = time.perf_counter()
+            _add("agent_setup", entered - start)
+            try:
+                yield agent
+            finally:
+                _add("llm_run", time.perf_counter() - entered)
+    agent_pool.acquire = timed_acquire
+
+    trace_turn = chat_handler.trace_turn
+
+    @contextmanager
+    def recorded_trace(**attrs):
+        # handle_chat marks the turn's outcome on this dict ("ok", "no_reply", "error")
+        with trace_turn(**attrs) as turn:
+            timings = _turn.get(None)
+            if timings is not None:
+                timings["_trace"] = turn
+            yield turn
+    chat_handler.trace_turn = recorded_trace
+
+    send = FakeChannel.send
+
+    async def timed_send(self, *args, **kwargs):
+        start = time.perf_counter()
+        timings = _turn.get(None)
+        if timings is not None and "first_reply" not in timings:
+            timings["first_reply"] = start - timings["_start"]
+        try:
+            return await send(self, *args, **kwargs)
+        finally:
+            _add("reply", time.perf_counter() - start)
+    FakeChannel.send = timed_send
+
+async def run(args):
+    llm = FakeLLMServer(args.ttft, args.tps, args.tokens)
+    base_url = await llm.start()
+    # Configure the bot for the stub before any project module reads the environment
+    os.environ.update({"GROQ_BASE_URL": base_url, "OPENROUTER_BASE_URL": base_url,
+                       "GROQ_API_KEY_1": "bench",
+                       # Background LLM work would hit the stub too and skew the request count
+                       "MEMORY_ENABLED": "false", "SUMMARY_ENABLED": "false",
+                       "STREAM_REPLIES": "true" if args.stream else "false"})
+    if not args.db:
+        os.environ["POSTGRES_URL"] = ""
+    os.environ.pop("GROQ_API_KEY_2", None)
+    os.environ.pop("OPENROUTER_API_KEY", None)
+
+    from core.database import db_manager
+    from agent.agent_factory import agent_pool
+    import discord_bot.chat_handler as chat_handler
+
+    if args.db:
+        await db_manager.init()
+    instrument(chat_handler, agent_pool)
+
+    bot = FakeBot()
+    guild = FakeGuild(42)
+    channels = [FakeChannel(100 + i, guild) for i in range(args.channels)]
+    users = [FakeUser(500 + i, f"user{i}") for i in range(16)]
+    results: List[Dict[str, float]] = []
+    counter = iter(range(args.turns))
+
+    async def worker():
+        for i in counter:
+            channel = channels[i % len(channels)]
+            message = FakeMessage(f".what's up number {i}", users[i % len(users)], channel)
+            timings = {"_start": time.perf_counter()}
+            token = _turn.set(timings)
+            try:
+                await chat_handler.handle_chat(message, bot, None)
+            finally:
+                _turn.reset(token)
+            timings["total"] = time.perf_counter() - timings.pop("_start")
+            trace = timings.pop("_trace", None) or {}
+            if trace.get("outcome") == "error":
+                timings["_outcome"] = "failed"
+            elif trace.get("outcome") == "ok" and "first_reply" in timings:
+                timings["_outcome"] = "replied"
+            else:
+                timings["_outcome"] = "no reply"
+            results.append(timings)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    wall = time.perf_counter() - start
+    await llm.stop()
+    if args.db:
+        await db_manager.close()
+
+    outcomes = Counter(r["_outcome"] for r in results)
+    replied = [r for r in results if r["_outcome"] == "replied"]
+    print(f"{len(results)} turns, concurrency {args.concurrency}, {wall:.2f}s wall, "
+          f"{len(replied) / wall:.1f} replies/s, {llm.requests} LLM requests")
+    print("outcomes: " + ", ".join(f"{k} {outcomes.get(k, 0)}" for k in ("replied", "failed", "no reply")))
+    if not replied:
+        print("No turn replied; latency figures would be meaningless.")
+    else:
+        print(f"{'stage':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for stage in ("history", "agent_setup", "llm_run", "first_reply", "reply", "total"):
+            samples = [r[stage] for r in replied if stage in r]
+            if not samples: continue
+            print(f"{stage:<14}" + "".join(f"{percentile(samples, q) * 1000:>10.1f}" for q in (0.5, 0.95, 0.99)))
+    return len(replied) == len(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--ttft", type=float, default=0.3, help="fake LLM time to first token (s)")
+    parser.add_argument("--tps", type=float, default=80.0, help="fake LLM tokens per second")
+    parser.add_argument("--tokens", type=int, default=40, help="fake LLM reply length in tokens")
+    parser.add_argument("--stream", action="store_true", help="benchmark the streaming reply path")
+    parser.add_argument("--db", action="store_true", help="use the Postgres at POSTGRES_URL")
+    sys.exit(0 if asyncio.run(run(parser.parse_args())) else 1)
@@ -0,0 +1,83 @@
+"""
+Keyword search latency: ILIKE '%kw%' scan vs. the GIN-indexed tsvector search used by
+Database.search_content_by_keyword. Builds a scratch table `bench_messages` in the
+database at POSTGRES_URL (dropped afterwards).
+
+    python benchmarks/bench_search.py 1000000 10000000
+"""
+import os, sys, time, random, asyncio
+from datetime import datetime, timezone
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import POSTGRES_URL
+from core.database import Database
+
+WORDS = ("lol bruh game ranked match lost won pizza anime movie stream bot server "
+         "discord music song party exam homework sleep coffee meme clip raid boss").split()
+CHANNELS = [random.getrandbits(60) for _ in range(300)]
+QUERIES = ["pizza", "ranked match", "raid boss", "homework exam", "zzqx"]
+RUNS = 20
+
+async def fill(conn, rows: int):
+    await conn.execute("""
+        DROP TABLE IF EXISTS bench_messages;
+        CREATE UNLOGGED TABLE bench_messages (
+            message_id BIGINT PRIMARY KEY, channel_id BIGINT NOT NULL,
+            author_name TEXT NOT NULL, content TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+    """)
+    start, chunk = time.time(), 100_000
+    for base in range(0, rows, chunk):
+        records = [
+            (base + i, random.choice(CHANNELS), f"user{random.randrange(5000)}",
+             " ".join(random.choices(WORDS, k=random.randint(3, 20))),
+             datetime.fromtimestamp(start - (rows - base - i), tz=timezone.utc))
+            for i in range(min(chunk, rows - base))
+        ]
+        await conn.copy_records_to_table("bench_messages", records=records)
+    await conn.execute("""
+        CREATE INDEX ON bench_messages (channel_id, created_at DESC);
+        ALTER TABLE bench_messages ADD COLUMN content_tsv tsvector;
+        UPDATE bench_messages SET content_tsv = to_tsvector('simple', content);
+        CREATE INDEX ON bench_messages USING GIN (content_tsv);
+        ANALYZE bench_messages;
+    """)
+
+async def timed(conn, sql: str, *args) -> float:
+    samples = []
+    for _ in range(RUNS):
+        t = time.perf_counter()
+        await conn.fetch(sql, *args)
+        samples.append((time.perf_counter() - t) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+async def run(sizes):
+    conn = await asyncpg.connect(POSTGRES_URL.replace("postgresql+asyncpg://", "postgresql://"))
+    try:
+        for rows in sizes:
+            await fill(conn, rows)
+            print(f"\n{rows:,} rows (median of {RUNS} runs, ms)")
+            for q in QUERIES:
+                c_ids = random.sample(CHANNELS, 150)
+                ilike = await timed(conn, """
+                    SELECT content FROM bench_messages WHERE content ILIKE $1 AND channel_id = ANY($2::bigint[])
+                    ORDER BY created_at DESC LIMIT 50
+                """, f"%{q}%", c_ids)
+                fts = await timed(conn, """
+                    SELECT content FROM bench_messages, to_tsquery('simple', $1) AS q
+                    WHERE content_tsv @@ q AND channel_id = ANY($2::bigint[])
+                    ORDER BY ts_rank(content_tsv, q) DESC, created_at DESC LIMIT 50
+                """, Database._prefix_tsquery(q), c_ids)
+                print(f"  {q!r:16} ilike {ilike:9.2f}   tsvector {fts:9.2f}")
+    finally:
+        await conn.execute("DROP TABLE IF EXISTS bench_messages")
+        await conn.close()
+
+if __name__ == "__main__":
+    if not POSTGRES_URL:
+        sys.exit("POSTGRES_URL is required.")
+    asyncio.run(run([int(a) for a in sys.argv[1:]] or [1_000_000, 10_000_000]))
@@ -0,0 +1,51 @@
+"""
+Cold-start cost: import time of the heavy modules (each in a fresh interpreter) and the
+first request to a provider on a cold vs. pre-warmed shared HTTP client.
+
+    python benchmarks/bench_startup.py [--url https://api.groq.com/openai/v1] [--key $GROQ_API_KEY_1]
+"""
+import os, sys, time, asyncio, argparse, subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODULES = ["agno.agent", "exa_py", "firecrawl", "tools.web_tools", "agent.agent_factory", "main"]
+RUNS = 5
+
+def import_ms(module: str) -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    samples = []
+    for _ in range(RUNS):
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+        if out.returncode != 0:
+            return float("nan")
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return sorted(samples)[len(samples) // 2]
+
+async def first_request(url: str, key: str):
+    from core.http_client import get_http_client, warm_up, close_http_client
+    headers = {"Authorization": f"Bearer {key}"}
+
+    t = time.perf_counter()
+    await get_http_client().get(f"{url}/models", headers=headers)
+    cold = (time.perf_counter() - t) * 1000
+    await close_http_client()
+
+    await warm_up([("bench", url, key)])
+    t = time.perf_counter()
+    await get_http_client().get(f"{url}/models", headers=headers)
+    warm = (time.perf_counter() - t) * 1000
+    await close_http_client()
+    print(f"\nfirst request  cold {cold:8.1f} ms   after warm-up {warm:8.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--key", default=os.getenv("GROQ_API_KEY_1", ""))
+    args = parser.parse_args()
+
+    print(f"import time (median of {RUNS} fresh interpreters, ms)")
+    for module in MODULES:
+        print(f"  {module:22} {import_ms(module):9.1f}")
+    if args.url:
+        asyncio.run(first_request(args.url.rstrip("/"), args.key))
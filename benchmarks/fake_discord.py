@@ -0,0 +1,78 @@
+"""Minimal stand-ins for the discord.py objects handle_chat touches."""
+import asyncio, itertools
+from datetime import datetime, timezone
+from typing import List, Optional
+
+_ids = itertools.count(1_000_000_000_000_000_000)
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{user_id}>"
+
+class _Typing:
+    async def __aenter__(self): return self
+    async def __aexit__(self, *exc): return False
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.text_channels: List["FakeChannel"] = []
+        self.me = None
+
+class FakeChannel:
+    def __init__(self, channel_id: int, guild: Optional[FakeGuild] = None, send_latency: float = 0.05):
+        self.id = channel_id
+        self.guild = guild
+        self.send_latency = send_latency
+        self.sent: List["FakeMessage"] = []
+        if guild: guild.text_channels.append(self)
+
+    def typing(self):
+        return _Typing()
+
+    async def send(self, content: str, author: FakeUser) -> "FakeMessage":
+        await asyncio.sleep(self.send_latency)
+        msg = FakeMessage(content, author, self)
+        self.sent.append(msg)
+        return msg
+
+class FakeAttachment:
+    def __init__(self, url: str, content_type: str = "image/png", data: bytes = b""):
+        self.id = next(_ids)
+        self.url = url
+        self.content_type = content_type
+        self.size = len(data)
+        self._data = data
+
+    async def read(self) -> bytes:
+        return self._data
+
+class FakeMessage:
+    bot_user: FakeUser = FakeUser(1, "Hero")
+
+    def __init__(self, content: str, author: FakeUser, channel: FakeChannel, attachments: Optional[List[FakeAttachment]] = None):
+        self.id = next(_ids)
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.mentions: List[FakeUser] = []
+        self.attachments = attachments or []
+        self.created_at = datetime.now(timezone.utc)
+        self.edits = 0
+
+    async def reply(self, content: str, mention_author: bool = False) -> "FakeMessage":
+        return await self.channel.send(content, self.bot_user)
+
+    async def edit(self, content: str) -> "FakeMessage":
+        await asyncio.sleep(self.channel.send_latency)
+        self.content = content
+        self.edits += 1
+        return self
+
+class FakeBot:
+    def __init__(self):
+        self.user = FakeMessage.bot_user
@@ -0,0 +1,98 @@
+"""
+Local OpenAI-compatible stub for offline benchmarks. Serves /v1/chat/completions
+(plain and SSE streaming) and /v1/models with a configurable time-to-first-token
+and token rate, so `OpenAILike(base_url=...)` can point at it.
+
+    python benchmarks/fake_llm.py --port 8089 --ttft 0.3 --tps 80 --tokens 40
+"""
+import json, time, asyncio, argparse
+from typing import Optional
+
+class FakeLLMServer:
+    def __init__(self, ttft: float = 0.3, tokens_per_sec: float = 80.0, reply_tokens: int = 40):
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.reply_tokens = reply_tokens
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}/v1"
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _tokens(self):
+        return [f"tok{i} " for i in range(self.reply_tokens)]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line: break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""): break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+
+                if path.endswith("/models"):
+                    await self._send_json(writer, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+                    continue
+                payload = json.loads(body or b"{}")
+                await asyncio.sleep(self.ttft)
+                if payload.get("stream"):
+                    await self._send_stream(writer, payload.get("model", "fake"))
+                    break  # streamed responses end by closing the connection
+                await asyncio.sleep(self.reply_tokens / self.tokens_per_sec)
+                await self._send_json(writer, {
+                    "id": f"chatcmpl-{self.requests}", "object": "chat.completion", "created": int(time.time()),
+                    "model": payload.get("model", "fake"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "".join(self._tokens()).strip()}}],
+                    "usage": {"prompt_tokens": 1000, "completion_tokens": self.reply_tokens, "total_tokens": 1000 + self.reply_tokens}
+                })
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # client went away, or the server is shutting down
+        finally:
+            writer.close()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, obj: dict):
+        data = json.dumps(obj).encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     + f"Content-Length: {len(data)}\r\nConnection: keep-alive\r\n\r\n".encode() + data)
+        await writer.drain()
+
+    async def _send_stream(self, writer: asyncio.StreamWriter, model: str):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: close\r\n\r\n")
+        for i, token in enumerate(self._tokens()):
+            chunk = {"id": f"chatcmpl-{self.requests}", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            writer.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await writer.drain()
+            await asyncio.sleep(1 / self.tokens_per_sec)
+        done = {"id": f"chatcmpl-{self.requests}", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        writer.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode())
+        await writer.drain()
+
+async def _serve(args):
+    server = FakeLLMServer(args.ttft, args.tps, args.tokens)
+    print(f"Fake LLM listening on {await server.start(port=args.port)}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tps", type=float, default=80.0)
+    parser.add_argument("--tokens", type=int, default=40)
+    asyncio.run(_serve(parser.parse_args()))
@@ -9,6 +9,23 @@ PREFIX = os.getenv("PREFIX", ".")
 
 # Database
 POSTGRES_URL = os.getenv("POSTGRES_URL", "")
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "5000"))  # store_message waits when full
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "200"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "0.5"))  # seconds
+INGEST_READ_WAIT = float(os.getenv("INGEST_READ_WAIT", "2"))  # longest a history read waits for its channel's queued rows
+SEARCH_BACKFILL_BATCH = int(os.getenv("SEARCH_BACKFILL_BATCH", "5000"))  # rows per tsvector backfill step
+SEARCH_WINDOW_DAYS = int(os.getenv("SEARCH_WINDOW_DAYS", "0"))  # bound history searches to recent data; 0 searches everything
+SEARCH_READY_RECHECK = float(os.getenv("SEARCH_READY_RECHECK", "60"))  # seconds between checks for a finished search index
+# Opt-in: move `messages` to monthly range partitions on created_at (migrated on startup)
+MESSAGES_PARTITIONED = os.getenv("MESSAGES_PARTITIONED", "false").lower() == "true"
+MESSAGE_RETENTION_DAYS = int(os.getenv("MESSAGE_RETENTION_DAYS", "0"))  # 0 keeps everything
+MESSAGE_RETENTION_MODE = os.getenv("MESSAGE_RETENTION_MODE", "detach")  # "detach" keeps old months as tables, "drop" deletes them
+PARTITION_PREMAKE_MONTHS = int(os.getenv("PARTITION_PREMAKE_MONTHS", "2"))
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "21600"))  # seconds
+
+# Providers (overridable, e.g. to point at a local stub for benchmarks)
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
 
 # Models
 GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
@@ -16,16 +33,120 @@ GROQ_MEMORY_MODEL = os.getenv("GROQ_MEMORY_MODEL", "llama-3.1-8b-instant")
 GROQ_VISION_MODEL = os.getenv("GROQ_VISION_MODEL", "llama-3.2-90b-vision-preview")
 OPENROUTER_MODEL = os.getenv("OPENROUTER_CHAT_MODEL", "meta-llama/llama-3.3-70b-instruct")
 
+# Model routing (small model for chit-chat, large for tools / long turns)
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+GROQ_SMALL_MODEL = os.getenv("GROQ_SMALL_MODEL", GROQ_MEMORY_MODEL)
+OPENROUTER_SMALL_MODEL = os.getenv("OPENROUTER_SMALL_MODEL", "meta-llama/llama-3.1-8b-instruct")
+ROUTER_SMALL_MAX_CHARS = int(os.getenv("ROUTER_SMALL_MAX_CHARS", "60"))  # longer prompts go to the large model
+ROUTER_DEGRADE_P95 = float(os.getenv("ROUTER_DEGRADE_P95", "8"))  # seconds; large-model p95 above this routes small
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "20"))
+ROUTER_LATENCY_WINDOW = int(os.getenv("ROUTER_LATENCY_WINDOW", "100"))
+ROUTER_LATENCY_MAX_AGE = int(os.getenv("ROUTER_LATENCY_MAX_AGE", "300"))  # seconds; older samples stop counting
+
+# Background memory extraction (runs after the reply, on its own key and limits)
+MEMORY_ENABLED = os.getenv("MEMORY_ENABLED", "true").lower() == "true"
+MEMORY_API_KEY = os.getenv("MEMORY_API_KEY") or os.getenv("GROQ_API_KEY_2") or os.getenv("GROQ_API_KEY_1")
+MEMORY_DEBOUNCE = float(os.getenv("MEMORY_DEBOUNCE", "20"))  # seconds of quiet before a user's turns are processed
+MEMORY_BATCH_SIZE = int(os.getenv("MEMORY_BATCH_SIZE", "8"))  # turns that force processing early
+MEMORY_CONCURRENCY = int(os.getenv("MEMORY_CONCURRENCY", "1"))
+MEMORY_CALLS_PER_MINUTE = int(os.getenv("MEMORY_CALLS_PER_MINUTE", "10"))
+MEMORY_RECALL_LIMIT = int(os.getenv("MEMORY_RECALL_LIMIT", "10"))
+MEMORY_MAX_PER_USER = int(os.getenv("MEMORY_MAX_PER_USER", "50"))
+
+# Rolling channel summaries (history = summary + the newest raw messages; same key as memory)
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+SUMMARY_ACTIVE_TTL = int(os.getenv("SUMMARY_ACTIVE_TTL", "3600"))  # seconds after the bot's last turn a channel keeps being summarized
+SUMMARY_RAW_TAIL = int(os.getenv("SUMMARY_RAW_TAIL", "8"))  # newest messages always sent verbatim
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "6"))  # unsummarized messages beyond the tail that trigger an update
+SUMMARY_MAX_BATCH = int(os.getenv("SUMMARY_MAX_BATCH", "100"))  # messages folded in per call when catching up
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "1"))
+SUMMARY_CALLS_PER_MINUTE = int(os.getenv("SUMMARY_CALLS_PER_MINUTE", "6"))
+
 # Tools Config
 EXA_API_KEY = os.getenv("EXA_API_KEY", "")
 FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY", "")
 EXA_NUM_RESULTS = int(os.getenv("EXA_NUM_RESULTS", "3"))
 SCRAPE_MAX_CHARS = int(os.getenv("SCRAPE_MAX_CHARS", "15000"))
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "8"))
+WEB_SEARCH_CONCURRENCY = int(os.getenv("WEB_SEARCH_CONCURRENCY", "4"))
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "2"))
+WEB_SEARCH_TIMEOUT = float(os.getenv("WEB_SEARCH_TIMEOUT", "15"))
+SCRAPE_TIMEOUT = float(os.getenv("SCRAPE_TIMEOUT", "30"))
+TOOL_CACHE_TTL = int(os.getenv("TOOL_CACHE_TTL", "900"))  # seconds
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "256"))  # entries per tool
+TOOL_CACHE_PERSIST = os.getenv("TOOL_CACHE_PERSIST", "false").lower() == "true"
+TOOL_PASSAGE_CHARS = int(os.getenv("TOOL_PASSAGE_CHARS", "600"))  # passage size when compacting web results
+TOOL_DEDUPE_THRESHOLD = float(os.getenv("TOOL_DEDUPE_THRESHOLD", "0.8"))  # shingle overlap treated as duplicate
+
+# Vision preprocessing (needs Pillow; otherwise attachments go by URL)
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))  # px, longest side
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+IMAGE_MAX_DOWNLOAD_BYTES = int(os.getenv("IMAGE_MAX_DOWNLOAD_BYTES", str(20 * 1024 * 1024)))
+IMAGE_FETCH_CONCURRENCY = int(os.getenv("IMAGE_FETCH_CONCURRENCY", "4"))
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "64"))
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", "3600"))
+
+# Semantic history search (needs NumPy; fused with keyword search in search_chat_history)
+SEMANTIC_SEARCH = os.getenv("SEMANTIC_SEARCH", "true").lower() == "true"
+EMBEDDER = os.getenv("EMBEDDER", "hashing")  # "hashing" (no model) or "sentence-transformers"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "256"))  # hashing embedder only
+SEMANTIC_INDEX_DIR = os.getenv("SEMANTIC_INDEX_DIR", "data/semantic_index")
+SEMANTIC_TOP_K = int(os.getenv("SEMANTIC_TOP_K", "30"))
+SEMANTIC_MIN_SCORE = float(os.getenv("SEMANTIC_MIN_SCORE", "0.2"))  # cosine similarity floor
+SEMANTIC_BATCH_SIZE = int(os.getenv("SEMANTIC_BATCH_SIZE", "256"))  # messages embedded per step
+SEMANTIC_SAVE_EVERY = int(os.getenv("SEMANTIC_SAVE_EVERY", "5000"))  # new vectors before merging to disk
+
+# Discord lookups (BioTools)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "2000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "600"))  # seconds
 
 # Bot Logic
 MAX_HISTORY = int(os.getenv("MAX_HISTORY", "15"))
-KEY_COOLDOWN = int(os.getenv("KEY_COOLDOWN", "3600"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+TOOL_OUTPUT_TOKEN_BUDGET = int(os.getenv("TOOL_OUTPUT_TOKEN_BUDGET", "1500"))  # per tool call
+TOKEN_CHARS_PER_TOKEN = float(os.getenv("TOKEN_CHARS_PER_TOKEN", "4"))  # estimator fallback without tiktoken
+CONTEXT_CACHE_CHANNELS = int(os.getenv("CONTEXT_CACHE_CHANNELS", "500"))  # channels kept in memory
+CONTEXT_CACHE_IDLE = int(os.getenv("CONTEXT_CACHE_IDLE", "3600"))  # seconds before an idle channel is dropped
+KEY_COOLDOWN = int(os.getenv("KEY_COOLDOWN", "3600"))  # longest a key's circuit stays open
+KEY_OPEN_SECONDS = float(os.getenv("KEY_OPEN_SECONDS", "30"))  # first open period after repeated failures
+KEY_FAILURE_THRESHOLD = int(os.getenv("KEY_FAILURE_THRESHOLD", "3"))
+KEY_ERROR_DECAY = float(os.getenv("KEY_ERROR_DECAY", "0.2"))
+KEY_LATENCY_WINDOW = int(os.getenv("KEY_LATENCY_WINDOW", "50"))
+KEY_DEFAULT_LATENCY = float(os.getenv("KEY_DEFAULT_LATENCY", "3.0"))  # assumed for keys with no samples yet
+KEY_HEDGE_ENABLED = os.getenv("KEY_HEDGE_ENABLED", "false").lower() == "true"
+KEY_HEDGE_MIN_SAMPLES = int(os.getenv("KEY_HEDGE_MIN_SAMPLES", "20"))
+KEY_HEDGE_MIN_DELAY = float(os.getenv("KEY_HEDGE_MIN_DELAY", "1.5"))
 TZ = os.getenv("TZ", "Asia/Kolkata")
+PROMPT_TIME_GRANULARITY = max(1, int(os.getenv("PROMPT_TIME_GRANULARITY", "5")))  # minutes (>= 1); coarse time keeps prompts cacheable
+
+# Observability
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 disables the /metrics endpoint
+SLOW_TURN_MS = int(os.getenv("SLOW_TURN_MS", "8000"))  # log full span breakdown above this; 0 disables
+
+# Performance
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"  # used when the h2 package is installed
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120"))  # seconds an idle connection is kept
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+PROVIDER_WARMUP = os.getenv("PROVIDER_WARMUP", "true").lower() == "true"  # pre-connect to LLM providers after login
+MAX_CONCURRENT_TURNS = int(os.getenv("MAX_CONCURRENT_TURNS", "8"))  # global cap on in-flight agent runs
+TURN_COALESCE_WINDOW = float(os.getenv("TURN_COALESCE_WINDOW", "0.4"))  # seconds to gather a burst
+CHANNEL_QUEUE_LIMIT = int(os.getenv("CHANNEL_QUEUE_LIMIT", "5"))  # pending prompts per channel before shedding
+TURN_MAX_WAIT = float(os.getenv("TURN_MAX_WAIT", "60"))  # seconds a turn may wait for a global slot
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "false").lower() == "true"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.2"))  # seconds between message edits
+STREAM_FIRST_CHUNK_CHARS = int(os.getenv("STREAM_FIRST_CHUNK_CHARS", "24"))
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "4"))  # idle agents kept per (key, model, provider)
+# Multi-process mode: agent runs move to worker processes; 0 keeps everything in one process
+MULTIPROCESS_WORKERS = int(os.getenv("MULTIPROCESS_WORKERS", "0"))
+WORKER_MAX_TURNS = int(os.getenv("WORKER_MAX_TURNS", "4"))  # concurrent turns per worker
+WORKER_TURN_TIMEOUT = float(os.getenv("WORKER_TURN_TIMEOUT", "180"))
+WORKER_CANCEL_GRACE = float(os.getenv("WORKER_CANCEL_GRACE", "10"))  # a timed-out turn must stop this soon, or its worker is restarted
+WORKER_RPC_TIMEOUT = float(os.getenv("WORKER_RPC_TIMEOUT", "15"))  # worker -> gateway lookups
+WORKER_HEALTH_INTERVAL = float(os.getenv("WORKER_HEALTH_INTERVAL", "10"))
+WORKER_HEALTH_TIMEOUT = float(os.getenv("WORKER_HEALTH_TIMEOUT", "60"))  # no pong for this long -> restart
 
 # --- HUMAN BRAIN PERSONA (PORTED FROM JUNKIE PROJECT) ---
 DEFAULT_PERSONA = """You are **Hero Companion**, and you were developed by "squiddrill"[ His alt "rowtten"] He is an AI enthusiast (short name: hero). You interact with users through text messages via Discord and have access to a wide range of tools.
@@ -1,14 +1,66 @@
-import asyncpg, logging
-from typing import List, Dict, Optional
-from core.config import POSTGRES_URL
+import asyncpg, asyncio, logging, re, time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Dict, Optional, Tuple
+from core.config import *
 
 logger = logging.getLogger("Database")
 
 class Database:
+    # Partitioned tables need the partition key in every unique constraint. Unchanged
+    # rows (e.g. history re-indexed on restart) are not rewritten and not returned.
+    INSERT_MESSAGE = """
+        INSERT INTO messages (message_id, channel_id, author_id, author_name, content, created_at, guild_id)
+        SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::bigint[], $4::text[], $5::text[],
+                             $6::timestamptz[], $7::bigint[])
+        ON CONFLICT ({conflict}) DO UPDATE SET content = EXCLUDED.content,
+            guild_id = COALESCE(EXCLUDED.guild_id, messages.guild_id)
+        WHERE messages.content IS DISTINCT FROM EXCLUDED.content
+            OR (messages.guild_id IS NULL AND EXCLUDED.guild_id IS NOT NULL)
+        RETURNING message_id
+    """
+    PARTITIONED_MESSAGES = """
+        CREATE TABLE messages (
+            message_id BIGINT NOT NULL,
+            channel_id BIGINT NOT NULL,
+            author_id BIGINT NOT NULL,
+            author_name TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            content_tsv tsvector,
+            guild_id BIGINT,
+            PRIMARY KEY (message_id, created_at)
+        ) PARTITION BY RANGE (created_at);
+        CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+    """
+    MESSAGE_INDEXES = ("idx_msgs_chan", "idx_msgs_auth_name", "idx_msgs_tsv", "idx_msgs_guild", "idx_msgs_no_guild")
+
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
+        self.partitioned = False
+        self.insert_message = self.INSERT_MESSAGE.format(conflict="message_id")
+        self._partition_maintenance: Optional[asyncio.Task] = None
+        # Write-behind ingestion: store_message enqueues, one task flushes in batches
+        self.queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+        # Rows are numbered as they are queued; the flusher writes them in that order, so
+        # "written up to N" tells a reader whether its channel's newest row is in the table
+        self._enqueued_seq = 0
+        self._written_seq = 0
+        self._channel_seq: Dict[int, int] = {}  # channel -> number of its newest queued row
+        self._written = asyncio.Condition()
+        self._ingest_listeners: List[Callable[[List[tuple]], None]] = []
+        self.ingest_stats = {"enqueued": 0, "flushed_rows": 0, "dropped_rows": 0, "flushes": 0, "flush_errors": 0,
+                             "backpressure_waits": 0, "last_flush_ms": 0.0, "max_flush_ms": 0.0}
+        # Full-text search is used once the tsvector backfill and GIN index are done
+        self.search_ready = False
+        self._search_checked = 0.0  # last catalog check, in processes that don't migrate
+        self._search_migration: Optional[asyncio.Task] = None
+        self._guild_migration: Optional[asyncio.Task] = None
+        self._guild_filled: set = set()  # channels already backfilled by this process
 
-    async def init(self):
+    async def init(self, migrate: bool = True):
+        """Connects and migrates; `migrate=False` only connects (agent workers read, the gateway writes)."""
+        if self.pool: return  # on_ready fires again after reconnects
         if not POSTGRES_URL:
             logger.error("POSTGRES_URL is missing!")
             return
@@ -17,6 +69,16 @@ class Database:
             url = POSTGRES_URL.replace("postgresql+asyncpg://", "postgresql://")
             self.pool = await asyncpg.create_pool(url)
             async with self.pool.acquire() as conn:
+                if MESSAGES_PARTITIONED and migrate:
+                    await self._convert_to_partitioned(conn)
+                self.partitioned = await conn.fetchval(
+                    "SELECT relkind::text = 'p' FROM pg_class WHERE oid = to_regclass('messages')"
+                ) or False
+                if self.partitioned:
+                    self.insert_message = self.INSERT_MESSAGE.format(conflict="message_id, created_at")
+                if not migrate:
+                    await self._check_search_ready(conn)
+                    return
                 await conn.execute("""
                     CREATE TABLE IF NOT EXISTS messages (
                         message_id BIGINT PRIMARY KEY,
@@ -28,28 +90,409 @@ class Database:
                     );
                     CREATE INDEX IF NOT EXISTS idx_msgs_chan ON messages (channel_id, created_at DESC);
                     CREATE INDEX IF NOT EXISTS idx_msgs_auth_name ON messages (author_name);
+                    CREATE TABLE IF NOT EXISTS tool_cache (
+                        kind TEXT NOT NULL,
+                        cache_key TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (kind, cache_key)
+                    );
+                    CREATE TABLE IF NOT EXISTS user_memories (
+                        id BIGSERIAL PRIMARY KEY,
+                        user_id BIGINT NOT NULL,
+                        memory TEXT NOT NULL,
+                        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_user_memories ON user_memories (user_id, created_at DESC);
+                    CREATE TABLE IF NOT EXISTS channel_summaries (
+                        channel_id BIGINT PRIMARY KEY,
+                        summary TEXT NOT NULL,
+                        last_message_id BIGINT NOT NULL,
+                        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                    );
+                    ALTER TABLE messages ADD COLUMN IF NOT EXISTS content_tsv tsvector;
+                    ALTER TABLE messages ADD COLUMN IF NOT EXISTS guild_id BIGINT;
+                    CREATE OR REPLACE FUNCTION messages_tsv_update() RETURNS trigger AS $$
+                    BEGIN
+                        NEW.content_tsv := to_tsvector('simple', NEW.content);
+                        RETURN NEW;
+                    END $$ LANGUAGE plpgsql;
+                    DO $$ BEGIN
+                        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_messages_tsv'
+                                       AND tgrelid = 'messages'::regclass) THEN
+                            CREATE TRIGGER trg_messages_tsv BEFORE INSERT OR UPDATE OF content ON messages
+                            FOR EACH ROW EXECUTE FUNCTION messages_tsv_update();
+                        END IF;
+                    END $$;
                 """)
+            self._search_migration = asyncio.create_task(self._migrate_search_index())
+            if self.partitioned:
+                self._partition_maintenance = asyncio.create_task(self._maintain_partitions())
+            self.queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+            self._flusher = asyncio.create_task(self._flush_loop())
             logger.info("Database initialized.")
         except Exception as e:
             logger.error(f"DB Init Error: {e}")
 
-    async def store_message(self, msg_id, channel_id, author_id, author_name, content, created_at):
-        if not self.pool or not content: return
+    # --- FULL-TEXT SEARCH MIGRATION (online: batched backfill, concurrent index build) ---
+
+    async def _migrate_search_index(self):
+        try:
+            last_id, filled = 0, 0
+            while True:
+                async with self.pool.acquire() as conn:
+                    ids = await conn.fetch("""
+                        WITH batch AS (
+                            SELECT message_id FROM messages
+                            WHERE message_id > $1 AND content_tsv IS NULL
+                            ORDER BY message_id LIMIT $2
+                        )
+                        UPDATE messages m SET content_tsv = to_tsvector('simple', m.content)
+                        FROM batch WHERE m.message_id = batch.message_id
+                        RETURNING m.message_id
+                    """, last_id, SEARCH_BACKFILL_BATCH)
+                if not ids: break
+                filled += len(ids)
+                last_id = max(r['message_id'] for r in ids)
+                await asyncio.sleep(0)  # yield to the gateway between batches
+            async with self.pool.acquire() as conn:
+                await self._create_index(conn, "idx_msgs_tsv", "USING GIN (content_tsv)")
+            self.search_ready = True
+            logger.info(f"Full-text search ready ({filled} rows backfilled).")
+        except Exception as e:
+            logger.error(f"Search Migration Error: {e}")
+
+    # --- GUILD SCOPE MIGRATION (rows stored before guild_id existed) ---
+
+    def start_guild_backfill(self, channel_guilds: Dict[int, int]):
+        """Fills guild_id for old rows from the bot's channel -> guild map, then indexes it."""
+        if not self.pool or (self._guild_migration and not self._guild_migration.done()): return
+        # on_ready fires again on every reconnect; only channels not yet seen need a pass
+        channel_guilds = {c: g for c, g in channel_guilds.items() if c not in self._guild_filled}
+        if not channel_guilds: return
+        self._guild_migration = asyncio.create_task(self._migrate_guild_ids(channel_guilds))
+
+    async def _migrate_guild_ids(self, channel_guilds: Dict[int, int]):
         try:
+            channel_ids, guild_ids = list(channel_guilds.keys()), list(channel_guilds.values())
+            filled = 0
+            # Rows still missing a guild_id (old rows, and DM rows forever) are found through a
+            # small partial index instead of scanning the table on every start
             async with self.pool.acquire() as conn:
+                await self._create_index(conn, "idx_msgs_no_guild", "(channel_id) WHERE guild_id IS NULL")
+            while channel_ids:
+                async with self.pool.acquire() as conn:
+                    updated = await conn.fetchval("""
+                        WITH map AS (
+                            SELECT * FROM unnest($1::bigint[], $2::bigint[]) AS c(channel_id, guild_id)
+                        ), batch AS (
+                            SELECT m.message_id, map.guild_id FROM messages m
+                            JOIN map ON map.channel_id = m.channel_id
+                            WHERE m.channel_id = ANY($1::bigint[]) AND m.guild_id IS NULL LIMIT $3
+                        ), done AS (
+                            UPDATE messages m SET guild_id = batch.guild_id
+                            FROM batch WHERE m.message_id = batch.message_id
+                            RETURNING 1
+                        )
+                        SELECT count(*) FROM done
+                    """, channel_ids, guild_ids, SEARCH_BACKFILL_BATCH)
+                if not updated: break
+                filled += updated
+                await asyncio.sleep(0)
+            async with self.pool.acquire() as conn:
+                await self._create_index(conn, "idx_msgs_guild", "(guild_id, created_at DESC)")
+            self._guild_filled.update(channel_ids)
+            logger.info(f"Guild scope ready ({filled} rows backfilled).")
+        except Exception as e:
+            logger.error(f"Guild Migration Error: {e}")
+
+    async def _create_index(self, conn, name: str, definition: str):
+        """Builds an index on messages without blocking ingest where Postgres allows it."""
+        # CONCURRENTLY must run outside a transaction and is not supported on partitioned
+        # parents; there the partitions are small and the index is created with the table
+        concurrently = "" if self.partitioned else "CONCURRENTLY "
+        # An interrupted concurrent build leaves an INVALID index that IF NOT EXISTS would accept
+        if await self._index_valid(conn, name) is False:
+            logger.warning(f"Index {name} is invalid (interrupted build); rebuilding it.")
+            await conn.execute(f"DROP INDEX {concurrently}IF EXISTS {name}")
+        await conn.execute(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON messages {definition}")
+        if not await self._index_valid(conn, name):
+            raise RuntimeError(f"Index {name} is not valid after the build")
+
+    async def _check_search_ready(self, conn) -> bool:
+        """
+        Processes that don't run the migration (agent workers) learn that the search index
+        is finished from the catalog, re-checked at most every SEARCH_READY_RECHECK seconds.
+        """
+        if self.search_ready or self._search_migration is not None: return self.search_ready
+        if time.monotonic() - self._search_checked < SEARCH_READY_RECHECK: return False
+        self.search_ready = bool(await self._index_valid(conn, "idx_msgs_tsv"))
+        self._search_checked = time.monotonic()
+        return self.search_ready
+
+    @staticmethod
+    async def _index_valid(conn, name: str) -> Optional[bool]:
+        """None when the index does not exist, otherwise whether queries can use it."""
+        return await conn.fetchval("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1)", name)
+
+    # --- PARTITIONING (monthly ranges on created_at, opt-in) ---
+
+    @staticmethod
+    def _month_start(dt: datetime, offset: int = 0) -> datetime:
+        index = dt.year * 12 + dt.month - 1 + offset
+        return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+    @staticmethod
+    def _retention_cutoff() -> Optional[datetime]:
+        if not MESSAGE_RETENTION_DAYS: return None
+        return datetime.now(timezone.utc) - timedelta(days=MESSAGE_RETENTION_DAYS)
+
+    async def _create_partitions(self, conn, start: datetime, end: datetime):
+        """Creates the monthly partitions covering [start, end]."""
+        month = self._month_start(start)
+        while month <= end:
+            upper = self._month_start(month, 1)
+            try:
+                async with conn.transaction():  # a savepoint when called inside the conversion
+                    await conn.execute(f"""
+                        CREATE TABLE IF NOT EXISTS messages_p{month:%Y%m} PARTITION OF messages
+                        FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')
+                    """)
+            except Exception as e:
+                # Rows for this month already sit in messages_default; they stay there
+                logger.warning(f"Partition messages_p{month:%Y%m} not created: {e}")
+            month = upper
+
+    async def _convert_to_partitioned(self, conn):
+        """
+        Makes `messages` a partitioned table. An existing plain table is renamed to
+        messages_unpartitioned (with its indexes, so names stay free) and its rows are
+        copied over in the background by the maintenance task.
+        """
+        kind = await conn.fetchval("SELECT relkind::text FROM pg_class WHERE oid = to_regclass('messages')")
+        if kind == 'p': return
+        async with conn.transaction():
+            oldest = None
+            if kind == 'r':
                 await conn.execute("""
-                    INSERT INTO messages (message_id, channel_id, author_id, author_name, content, created_at)
-                    VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (message_id) DO NOTHING
-                """, msg_id, channel_id, author_id, author_name, content, created_at)
+                    ALTER TABLE messages RENAME TO messages_unpartitioned;
+                    ALTER TABLE messages_unpartitioned RENAME CONSTRAINT messages_pkey TO messages_unpartitioned_pkey;
+                    ALTER TABLE messages_unpartitioned ADD COLUMN IF NOT EXISTS guild_id BIGINT;
+                """)
+                for index in self.MESSAGE_INDEXES:
+                    await conn.execute(f"ALTER INDEX IF EXISTS {index} RENAME TO {index}_unpartitioned")
+                oldest = await conn.fetchval("SELECT min(created_at) FROM messages_unpartitioned")
+            await conn.execute(self.PARTITIONED_MESSAGES)
+            await conn.execute("""
+                CREATE INDEX idx_msgs_tsv ON messages USING GIN (content_tsv);
+                CREATE INDEX idx_msgs_guild ON messages (guild_id, created_at DESC);
+            """)
+            now = datetime.now(timezone.utc)
+            cutoff = self._retention_cutoff()
+            start = max(filter(None, (oldest, cutoff))) if oldest else now
+            await self._create_partitions(conn, start, self._month_start(now, PARTITION_PREMAKE_MONTHS))
+        logger.info("Messages table converted to monthly partitions.")
+
+    async def _copy_unpartitioned(self):
+        """Copies rows from the pre-partitioning table in message_id order, then drops it."""
+        async with self.pool.acquire() as conn:
+            if not await conn.fetchval("SELECT to_regclass('messages_unpartitioned') IS NOT NULL"): return
+        last_id, cutoff = 0, self._retention_cutoff()
+        while True:
+            async with self.pool.acquire() as conn:
+                last = await conn.fetchval("""
+                    WITH batch AS (
+                        SELECT message_id, channel_id, author_id, author_name, content,
+                               COALESCE(created_at, NOW()) AS created_at, guild_id
+                        FROM messages_unpartitioned
+                        WHERE message_id > $1 AND ($3::timestamptz IS NULL OR created_at >= $3)
+                        ORDER BY message_id LIMIT $2
+                    ), copied AS (
+                        INSERT INTO messages (message_id, channel_id, author_id, author_name, content, created_at, guild_id)
+                        SELECT * FROM batch ON CONFLICT DO NOTHING
+                    )
+                    SELECT max(message_id) FROM batch
+                """, last_id, SEARCH_BACKFILL_BATCH, cutoff)
+            if last is None: break
+            last_id = last
+            await asyncio.sleep(0)
+        async with self.pool.acquire() as conn:
+            await conn.execute("DROP TABLE messages_unpartitioned")
+        logger.info("Pre-partitioning messages copied; old table dropped.")
+
+    async def _apply_retention(self, conn):
+        """Drops or detaches whole months older than the retention window."""
+        cutoff = self._retention_cutoff()
+        if not cutoff: return
+        partitions = await conn.fetch("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'messages'::regclass
+        """)
+        for row in partitions:
+            match = re.fullmatch(r"messages_p(\d{4})(\d{2})", row['relname'])
+            if not match: continue
+            month = datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)
+            if self._month_start(month, 1) > cutoff: continue
+            if MESSAGE_RETENTION_MODE == "drop":
+                await conn.execute(f"DROP TABLE {row['relname']}")
+            else:
+                await conn.execute(f"ALTER TABLE messages DETACH PARTITION {row['relname']}")
+            logger.info(f"Retention: {MESSAGE_RETENTION_MODE} {row['relname']}")
+        await conn.execute("DELETE FROM messages_default WHERE created_at < $1", cutoff)
+
+    async def _maintain_partitions(self):
+        try:
+            await self._copy_unpartitioned()
         except Exception as e:
-            pass # Silent fail to prevent log spam during massive indexing
+            logger.error(f"Partition Copy Error: {e}")
+        while True:
+            try:
+                async with self.pool.acquire() as conn:
+                    now = datetime.now(timezone.utc)
+                    await self._create_partitions(conn, now, self._month_start(now, PARTITION_PREMAKE_MONTHS))
+                    await self._apply_retention(conn)
+            except Exception as e:
+                logger.error(f"Partition Maintenance Error: {e}")
+            await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+    @staticmethod
+    def _search_window(param: int) -> Tuple[str, list]:
+        """Optional `created_at` lower bound; lets partitioned searches skip old months."""
+        if not SEARCH_WINDOW_DAYS: return "", []
+        since = datetime.now(timezone.utc) - timedelta(days=SEARCH_WINDOW_DAYS)
+        return f"AND created_at >= ${param}", [since]
+
+    @staticmethod
+    def _scope(guild_id: Optional[int], channel_id: Optional[int]):
+        """Guild-wide filter when in a server, the single channel in DMs."""
+        return ("guild_id", guild_id) if guild_id else ("channel_id", channel_id)
+
+    @staticmethod
+    def _prefix_tsquery(text: str) -> Optional[str]:
+        """'john fight' -> 'john:* & fight:*' (prefix match keeps ILIKE-like partial words)."""
+        words = re.findall(r"\w+", text.lower())
+        return " & ".join(f"{w}:*" for w in words) if words else None
+
+    async def store_message(self, msg_id, channel_id, author_id, author_name, content, created_at, guild_id=None):
+        """Queues a message for the batched writer; waits only when the queue is full."""
+        if self.queue is None or not content: return  # no writer (init failed, or a read-only worker)
+        cutoff = self._retention_cutoff() if self.partitioned else None
+        if cutoff and created_at and created_at < cutoff: return  # would be dropped by retention anyway
+        if self.queue.full():
+            self.ingest_stats["backpressure_waits"] += 1
+        await self.queue.put((msg_id, channel_id, author_id, author_name, content, created_at, guild_id))
+        self._enqueued_seq += 1
+        self._channel_seq[channel_id] = self._enqueued_seq
+        self.ingest_stats["enqueued"] += 1
+
+    async def _flush_loop(self):
+        while True:
+            batch = [await self.queue.get()]
+            # Let a burst accumulate unless a full batch is already waiting
+            if self.queue.qsize() < INGEST_BATCH_SIZE - 1:
+                await asyncio.sleep(INGEST_FLUSH_INTERVAL)
+            while len(batch) < INGEST_BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            await self._write_batch(batch)
+
+    async def _insert_rows(self, conn, rows: List[tuple]) -> List[asyncpg.Record]:
+        """
+        Writes `rows` in one statement. One bad row fails the whole statement, so on a
+        data error the rows are retried one by one and only the failing ones are dropped.
+        """
+        try:
+            return await conn.fetch(self.insert_message, *(list(col) for col in zip(*rows)))
+        except (asyncpg.PostgresError, ValueError) as e:
+            if isinstance(e, asyncpg.PostgresConnectionError): raise
+            logger.warning(f"Ingest batch of {len(rows)} rows failed ({e}); retrying row by row")
+        written = []
+        for row in rows:
+            try:
+                written += await conn.fetch(self.insert_message, *([value] for value in row))
+            except (asyncpg.PostgresError, ValueError) as e:
+                if isinstance(e, asyncpg.PostgresConnectionError): raise
+                self.ingest_stats["dropped_rows"] += 1
+                logger.error(f"Dropping message {row[0]} from ingest: {e}")
+        return written
+
+    async def _write_batch(self, batch: List[tuple]):
+        start = time.perf_counter()
+        changed_rows = []
+        try:
+            # One row per message (the latest edit wins); ON CONFLICT can't touch a row twice
+            rows = list({row[0]: row for row in batch}.values())
+            async with self.pool.acquire() as conn:
+                written = await self._insert_rows(conn, rows)
+            self.ingest_stats["flushed_rows"] += len(written)
+            changed = {r['message_id'] for r in written}
+            changed_rows = [row for row in rows if row[0] in changed]
+        except Exception as e:
+            self.ingest_stats["flush_errors"] += 1
+            logger.error(f"Ingest Flush Error ({len(batch)} rows): {e}")
+        finally:
+            # Outside the write, so a failing listener is not counted as a failed flush
+            for listener in self._ingest_listeners if changed_rows else ():
+                try:
+                    listener(changed_rows)
+                except Exception as e:
+                    logger.error(f"Ingest listener failed: {e}")
+            ms = (time.perf_counter() - start) * 1000
+            self.ingest_stats["flushes"] += 1
+            self.ingest_stats["last_flush_ms"] = round(ms, 2)
+            self.ingest_stats["max_flush_ms"] = round(max(ms, self.ingest_stats["max_flush_ms"]), 2)
+            self._written_seq += len(batch)
+            for row in batch:
+                if self._channel_seq.get(row[1], 0) <= self._written_seq:
+                    self._channel_seq.pop(row[1], None)
+                self.queue.task_done()
+            async with self._written:
+                self._written.notify_all()
+
+    def add_ingest_listener(self, listener: Callable[[List[tuple]], None]):
+        """Called after each flush with the rows it inserted or changed (e.g. to index them)."""
+        self._ingest_listeners.append(listener)
+
+    async def flush(self, channel_id: Optional[int] = None, timeout: Optional[float] = INGEST_READ_WAIT):
+        """
+        Waits until the rows queued so far (only `channel_id`'s, if given) are written. Rows
+        queued later are not waited for; gives up after `timeout` (None waits, for shutdown).
+        """
+        if self.queue is None: return
+        target = self._enqueued_seq if channel_id is None else self._channel_seq.get(channel_id, 0)
+        if self._written_seq >= target: return
+
+        async def written():
+            async with self._written:
+                await self._written.wait_for(lambda: self._written_seq >= target)
+        try:
+            await asyncio.wait_for(written(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Ingest flush wait gave up after {timeout}s; reading without the newest rows.")
+
+    def ingest_metrics(self) -> Dict[str, float]:
+        return {**self.ingest_stats, "queue_depth": self.queue.qsize() if self.queue else 0}
+
+    async def close(self):
+        """Flushes queued messages, then shuts the pool down."""
+        for task in (self._search_migration, self._guild_migration, self._partition_maintenance):
+            if task and not task.done():
+                task.cancel()
+        if self._flusher:
+            await self.flush(timeout=None)
+            self._flusher.cancel()
+            self._flusher = None
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
 
     async def get_messages(self, channel_id: int, limit: int = 50) -> List[Dict]:
         if not self.pool: return []
+        # Read-your-writes: messages for this channel may still be sitting in the ingest queue
+        await self.flush(channel_id)
         try:
             async with self.pool.acquire() as conn:
                 rows = await conn.fetch("""
-                    SELECT author_name, author_id, content 
+                    SELECT message_id, author_name, author_id, content 
                     FROM messages 
                     WHERE channel_id = $1 
                     ORDER BY created_at DESC 
@@ -60,21 +503,53 @@ class Database:
             logger.error(f"Fetch Error: {e}")
             return []
 
+    async def get_messages_after(self, last_id: int, limit: int = 500) -> List[Dict]:
+        """Stored messages with message_id > last_id in id order, for incremental indexing."""
+        if not self.pool: return []
+        try:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch("""
+                    SELECT message_id, channel_id, guild_id, content
+                    FROM messages
+                    WHERE message_id > $1
+                    ORDER BY message_id
+                    LIMIT $2
+                """, last_id, limit)
+                return [dict(r) for r in rows]
+        except Exception as e:
+            logger.error(f"Fetch After Error: {e}")
+            return []
+
+    async def get_messages_by_ids(self, message_ids: List[int]) -> Dict[int, Dict]:
+        if not self.pool or not message_ids: return {}
+        try:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch("""
+                    SELECT message_id, content, author_name, created_at
+                    FROM messages
+                    WHERE message_id = ANY($1::bigint[])
+                """, message_ids)
+                return {r['message_id']: dict(r) for r in rows}
+        except Exception as e:
+            logger.error(f"Fetch By Id Error: {e}")
+            return {}
+
     async def search_global_messages_by_name(self, author_name: str, limit: int = 100) -> List[Dict]:
         """
         Deeper search for global recall. 
         Returns more messages (100) for better personality analysis.
         """
         if not self.pool: return []
+        window, window_args = self._search_window(3)
         try:
             async with self.pool.acquire() as conn:
-                rows = await conn.fetch("""
+                rows = await conn.fetch(f"""
                     SELECT content, author_name, created_at 
                     FROM messages 
-                    WHERE author_name ILIKE $1 
+                    WHERE author_name ILIKE $1 {window}
                     ORDER BY created_at DESC 
                     LIMIT $2
-                """, f"%{author_name}%", limit)
+                """, f"%{author_name}%", limit, *window_args)
                 return [dict(r) for r in rows]
         except Exception as e:
             logger.error(f"Global Search Error: {e}")
@@ -82,40 +557,190 @@ class Database:
 
     # --- APPENDED SEARCH METHODS FOR LOGIC FIXES ---
     
-    async def search_messages_in_batches(self, query: str, channel_ids: List[int], limit: int = 50) -> List[Dict]:
-        """Searches for a user name ONLY within specific channels (Current Server)."""
-        if not self.pool or not channel_ids: return []
+    async def search_messages_in_batches(self, query: str, guild_id: Optional[int], channel_id: Optional[int] = None, limit: int = 50) -> List[Dict]:
+        """Searches for a user name ONLY within the current server (or the DM channel)."""
+        column, scope_id = self._scope(guild_id, channel_id)
+        if not self.pool or not scope_id: return []
+        window, window_args = self._search_window(4)
         try:
             async with self.pool.acquire() as conn:
-                rows = await conn.fetch("""
+                rows = await conn.fetch(f"""
                     SELECT content, author_name, created_at 
                     FROM messages 
                     WHERE author_name ILIKE $1 
-                    AND channel_id = ANY($2::bigint[])
+                    AND {column} = $2 {window}
                     ORDER BY created_at DESC 
                     LIMIT $3
-                """, f"%{query}%", channel_ids, limit)
+                """, f"%{query}%", scope_id, limit, *window_args)
                 return [dict(r) for r in rows]
         except Exception as e:
             logger.error(f"Batch Search Error: {e}")
             return []
 
-    async def search_content_by_keyword(self, keyword: str, channel_ids: List[int], limit: int = 50) -> List[Dict]:
-        """Searches message CONTENT for keywords (events, actions) in specific channels."""
-        if not self.pool or not channel_ids: return []
+    async def search_content_by_keyword(self, keyword: str, guild_id: Optional[int], channel_id: Optional[int] = None, limit: int = 50) -> List[Dict]:
+        """
+        Searches message CONTENT for keywords (events, actions) in the current server.
+        Uses the GIN-indexed tsvector ranked by relevance (newest first on ties); falls back
+        to an ILIKE scan only while the search index is still being built.
+        """
+        column, scope_id = self._scope(guild_id, channel_id)
+        if not self.pool or not scope_id: return []
+        tsquery = self._prefix_tsquery(keyword)
+        window, window_args = self._search_window(4)
+        try:
+            async with self.pool.acquire() as conn:
+                if tsquery and await self._check_search_ready(conn):
+                    rows = await conn.fetch(f"""
+                        SELECT message_id, content, author_name, created_at
+                        FROM messages, to_tsquery('simple', $1) AS q
+                        WHERE content_tsv @@ q
+                        AND {column} = $2 {window}
+                        ORDER BY ts_rank(content_tsv, q) DESC, created_at DESC
+                        LIMIT $3
+                    """, tsquery, scope_id, limit, *window_args)
+                else:
+                    rows = await conn.fetch(f"""
+                        SELECT message_id, content, author_name, created_at 
+                        FROM messages 
+                        WHERE content ILIKE $1 
+                        AND {column} = $2 {window}
+                        ORDER BY created_at DESC 
+                        LIMIT $3
+                    """, f"%{keyword}%", scope_id, limit, *window_args)
+                return [dict(r) for r in rows]
+        except Exception as e:
+            logger.error(f"Content Search Error: {e}")
+            return []
+
+    # --- USER MEMORIES (written by the background memory worker) ---
+
+    async def get_user_memories(self, user_id: int, limit: int = 20) -> List[str]:
+        if not self.pool: return []
         try:
             async with self.pool.acquire() as conn:
                 rows = await conn.fetch("""
-                    SELECT content, author_name, created_at 
-                    FROM messages 
-                    WHERE content ILIKE $1 
-                    AND channel_id = ANY($2::bigint[])
-                    ORDER BY created_at DESC 
+                    SELECT memory FROM user_memories
+                    WHERE user_id = $1
+                    ORDER BY created_at DESC
+                    LIMIT $2
+                """, user_id, limit)
+                return [r['memory'] for r in reversed(rows)]
+        except Exception as e:
+            logger.error(f"Memory Fetch Error: {e}")
+            return []
+
+    async def add_user_memories(self, user_id: int, memories: List[str], keep: int = 50):
+        """Appends memories and prunes the user's oldest ones beyond `keep`."""
+        if not self.pool or not memories: return
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.executemany(
+                        "INSERT INTO user_memories (user_id, memory) VALUES ($1, $2)",
+                        [(user_id, m) for m in memories]
+                    )
+                    await conn.execute("""
+                        DELETE FROM user_memories WHERE user_id = $1 AND id NOT IN (
+                            SELECT id FROM user_memories WHERE user_id = $1
+                            ORDER BY created_at DESC, id DESC LIMIT $2
+                        )
+                    """, user_id, keep)
+        except Exception as e:
+            logger.error(f"Memory Write Error: {e}")
+
+    # --- CHANNEL SUMMARIES (written by the background channel summarizer) ---
+
+    async def get_channel_messages_after(self, channel_id: int, after_id: int, limit: int = 100) -> List[Dict]:
+        """A channel's messages newer than `after_id`, oldest first."""
+        if not self.pool: return []
+        await self.flush(channel_id)
+        try:
+            async with self.pool.acquire() as conn:
+                # The created_at bound (the snowflake's timestamp) keeps this on idx_msgs_chan
+                rows = await conn.fetch("""
+                    SELECT message_id, author_name, author_id, content
+                    FROM messages
+                    WHERE channel_id = $1 AND message_id > $2
+                    AND created_at >= to_timestamp((($2 >> 22) + 1420070400000) / 1000.0)
+                    ORDER BY created_at, message_id
                     LIMIT $3
-                """, f"%{keyword}%", channel_ids, limit)
+                """, channel_id, after_id, limit)
                 return [dict(r) for r in rows]
         except Exception as e:
-            logger.error(f"Content Search Error: {e}")
+            logger.error(f"Channel Fetch After Error: {e}")
+            return []
+
+    async def get_channel_messages_between(self, channel_id: int, after_id: int, before_id: int, limit: int = 100) -> List[Dict]:
+        """The newest `limit` of a channel's messages with after_id < id < before_id, oldest first."""
+        if not self.pool: return []
+        await self.flush(channel_id)
+        try:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch("""
+                    SELECT message_id, author_name, author_id, content
+                    FROM messages
+                    WHERE channel_id = $1 AND message_id > $2 AND message_id < $3
+                    AND created_at >= to_timestamp((($2 >> 22) + 1420070400000) / 1000.0)
+                    AND created_at <= to_timestamp((($3 >> 22) + 1420070400000) / 1000.0)
+                    ORDER BY created_at DESC, message_id DESC
+                    LIMIT $4
+                """, channel_id, after_id, before_id, limit)
+                return [dict(r) for r in reversed(rows)]
+        except Exception as e:
+            logger.error(f"Channel Fetch Between Error: {e}")
             return []
 
+    async def get_channel_summary(self, channel_id: int) -> Optional[Dict]:
+        if not self.pool: return None
+        try:
+            async with self.pool.acquire() as conn:
+                row = await conn.fetchrow(
+                    "SELECT summary, last_message_id FROM channel_summaries WHERE channel_id = $1", channel_id
+                )
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Summary Fetch Error: {e}")
+            return None
+
+    async def set_channel_summary(self, channel_id: int, summary: str, last_message_id: int):
+        if not self.pool: return
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.execute("""
+                    INSERT INTO channel_summaries (channel_id, summary, last_message_id, updated_at)
+                    VALUES ($1, $2, $3, NOW())
+                    ON CONFLICT (channel_id) DO UPDATE SET summary = EXCLUDED.summary,
+                        last_message_id = EXCLUDED.last_message_id, updated_at = EXCLUDED.updated_at
+                """, channel_id, summary, last_message_id)
+        except Exception as e:
+            logger.error(f"Summary Write Error: {e}")
+
+    # --- TOOL RESULT CACHE (second tier behind the in-memory LRU) ---
+
+    async def get_tool_cache(self, kind: str, cache_key: str, max_age: float) -> Optional[str]:
+        """Returns a cached tool result younger than `max_age` seconds, if any."""
+        if not self.pool: return None
+        try:
+            async with self.pool.acquire() as conn:
+                return await conn.fetchval("""
+                    SELECT value FROM tool_cache
+                    WHERE kind = $1 AND cache_key = $2
+                    AND created_at > NOW() - make_interval(secs => $3)
+                """, kind, cache_key, float(max_age))
+        except Exception as e:
+            logger.error(f"Tool Cache Read Error: {e}")
+            return None
+
+    async def set_tool_cache(self, kind: str, cache_key: str, value: str):
+        if not self.pool: return
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.execute("""
+                    INSERT INTO tool_cache (kind, cache_key, value, created_at)
+                    VALUES ($1, $2, $3, NOW())
+                    ON CONFLICT (kind, cache_key) DO UPDATE SET value = EXCLUDED.value, created_at = EXCLUDED.created_at
+                """, kind, cache_key, value)
+        except Exception as e:
+            logger.error(f"Tool Cache Write Error: {e}")
+
 db_manager = Database()
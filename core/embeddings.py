@@ -0,0 +1,60 @@
+import re, hashlib, logging
+from typing import List, Optional
+from core.config import EMBEDDER, EMBEDDING_DIM, EMBEDDING_MODEL
+
+# NumPy is optional; semantic search is disabled without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger("Embeddings")
+
+_WORD = re.compile(r"\w+")
+
+class HashingEmbedder:
+    """
+    Dependency-free default: hashed word unigrams and character trigrams, L2-normalized.
+    Trigrams make it tolerant to typos and inflections ("fight" ~ "fighting") without
+    shipping a model; swap in a real model via EMBEDDER for paraphrase-level recall.
+    """
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORD.findall(text.lower())
+        features = [f"w:{w}" for w in words]
+        for w in words:
+            padded = f"#{w}#"
+            features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        return features
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                out[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-6)
+
+class SentenceTransformerEmbedder:
+    """Local CPU model via sentence-transformers (EMBEDDER=sentence-transformers)."""
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        return self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+def get_embedder() -> Optional[object]:
+    """The configured embedder, or None when semantic search cannot run here."""
+    if np is None: return None
+    if EMBEDDER == "sentence-transformers":
+        try:
+            return SentenceTransformerEmbedder()
+        except Exception as e:
+            logger.warning(f"sentence-transformers unavailable ({e}); using the hashing embedder.")
+    return HashingEmbedder()
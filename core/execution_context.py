@@ -13,3 +13,14 @@ def set_current_channel(channel: object):
 def get_current_channel() -> Optional[object]:
     """Gets the current Discord channel object from the execution context."""
     return _current_channel.get()
+
+# The user's prompt for the current turn, so tools can rank their output against it
+_current_query: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_query", default=None)
+
+def set_current_query(query: Optional[str]):
+    """Sets the user's prompt for the current turn in the execution context."""
+    _current_query.set(query)
+
+def get_current_query() -> Optional[str]:
+    """Gets the user's prompt for the current turn, if one is set."""
+    return _current_query.get()
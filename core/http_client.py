@@ -0,0 +1,54 @@
+import time, asyncio, logging, importlib.util
+from typing import Dict, List, Optional, Tuple
+import httpx
+from core.config import HTTP2_ENABLED, HTTP_MAX_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY, HTTP_TIMEOUT
+
+logger = logging.getLogger("HTTPClient")
+
+# HTTP/2 needs the optional `h2` package (httpx[http2]); plain keep-alive otherwise
+_HTTP2 = HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+
+_client: Optional[httpx.AsyncClient] = None
+warmup_stats: Dict[str, float] = {}
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    The one AsyncClient every model shares. Without it agno builds a new client (and
+    connection pool) per request, so each turn pays its own TLS handshake.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=_HTTP2,
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)
+        )
+    return _client
+
+async def warm_up(targets: List[Tuple[str, str, str]]):
+    """
+    Opens keep-alive connections ahead of the first turn. `targets` are
+    (name, base_url, api_key); `GET /models` is cheap and completes TLS (and ALPN).
+    """
+    client = get_http_client()
+
+    async def _one(name: str, base_url: str, api_key: str):
+        start = time.perf_counter()
+        try:
+            response = await client.get(f"{base_url.rstrip('/')}/models",
+                                        headers={"Authorization": f"Bearer {api_key}"})
+            warmup_stats[f"{name}_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            logger.info(f"Warmed {name} ({response.http_version}, {response.status_code}) "
+                        f"in {warmup_stats[f'{name}_ms']}ms")
+        except Exception as e:
+            logger.warning(f"Warm-up for {name} failed: {e}")
+
+    await asyncio.gather(*(_one(*t) for t in targets))
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
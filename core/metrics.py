@@ -0,0 +1,214 @@
+import time, json, asyncio, logging, functools, contextvars, itertools
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from core.config import METRICS_PORT, SLOW_TURN_MS
+
+logger = logging.getLogger("Metrics")
+
+# Seconds; covers a DB round trip up to a long tool-using LLM turn
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _labels_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted(labels.items()))
+
+def _fmt_labels(key: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in key] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name, self.help = name, help_text
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_fmt_labels(k)} {v}" for k, v in self.values.items()]
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.help, self.buckets = name, help_text, buckets
+        self.series: Dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = _labels_key(labels)
+        series = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self.series.items():
+            for bound, count in zip(self.buckets, series):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_fmt_labels(key, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_fmt_labels(key)} {series[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[object] = []
+        # name -> callable returning a (possibly nested) dict of numbers, exported as gauges
+        self.collectors: Dict[str, Callable[[], dict]] = {}
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        metric = Counter(name, help_text)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, name: str, fn: Callable[[], dict]):
+        self.collectors[name] = fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for name, fn in self.collectors.items():
+            try:
+                lines += [f"hero_{name}_{k} {v}" for k, v in _flatten(fn())]
+            except Exception as e:
+                logger.error(f"Collector {name} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+def _flatten(data: dict, prefix: str = ""):
+    for k, v in data.items():
+        key = f"{prefix}{k}".replace("-", "_").replace(".", "_").lower()
+        if isinstance(v, dict):
+            yield from _flatten(v, key + "_")
+        elif isinstance(v, bool):
+            yield key, int(v)
+        elif isinstance(v, (int, float)):
+            yield key, v
+
+registry = Registry()
+stage_seconds = registry.histogram("hero_stage_seconds", "Duration of chat pipeline stages and tool calls")
+turn_seconds = registry.histogram("hero_turn_seconds", "End-to-end chat turn duration")
+turns_total = registry.counter("hero_turns_total", "Chat turns by outcome")
+
+# --- PER-TURN SPANS ---
+_turn_ids = itertools.count(1)
+_current_turn: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("current_turn", default=None)
+
+@contextmanager
+def trace_turn(**attrs):
+    """Opens a turn; spans recorded inside (including tool calls) are attached to it."""
+    turn = {"turn_id": next(_turn_ids), **attrs, "spans": [], "outcome": "ok"}
+    token = _current_turn.set(turn)
+    start = time.perf_counter()
+    try:
+        yield turn
+    except BaseException:
+        turn["outcome"] = "error"
+        raise
+    finally:
+        total = time.perf_counter() - start
+        _current_turn.reset(token)
+        turn_seconds.observe(total)
+        turns_total.inc(outcome=turn["outcome"])
+        if SLOW_TURN_MS and total * 1000 >= SLOW_TURN_MS:
+            turn["total_ms"] = round(total * 1000, 1)
+            logger.warning(f"Slow turn: {json.dumps(turn, default=str)}")
+
+def current_turn() -> Optional[dict]:
+    return _current_turn.get()
+
+@contextmanager
+def span(stage: str, **labels):
+    """Times a stage into `hero_stage_seconds` and the current turn's breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage, **labels)
+        turn = _current_turn.get()
+        if turn is not None:
+            turn["spans"].append({"stage": stage, **labels, "ms": round(elapsed * 1000, 1)})
+
+# --- PER-ATTEMPT TOOL TIME ---
+class ToolClock:
+    """Wall time one model attempt spends inside its tools; overlapping calls count once."""
+    def __init__(self):
+        self.started = False
+        self.seconds = 0.0
+        self._active = 0
+        self._since = 0.0
+
+    def enter(self):
+        self.started = True
+        if self._active == 0:
+            self._since = time.perf_counter()
+        self._active += 1
+
+    def exit(self):
+        self._active -= 1
+        if self._active == 0:
+            self.seconds += time.perf_counter() - self._since
+
+_current_tool_clock: contextvars.ContextVar[Optional[ToolClock]] = contextvars.ContextVar("current_tool_clock", default=None)
+
+@contextmanager
+def tool_clock():
+    """Tool calls made inside (by the agent run) are timed into the yielded ToolClock."""
+    clock = ToolClock()
+    token = _current_tool_clock.set(clock)
+    try:
+        yield clock
+    finally:
+        _current_tool_clock.reset(token)
+
+def traced_tool(fn):
+    """Wraps an async tool so each call is a `tool` span; keeps the signature agno reads."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        clock = _current_tool_clock.get()
+        if clock is not None:
+            clock.enter()
+        try:
+            with span("tool", tool=fn.__name__):
+                return await fn(*args, **kwargs)
+        finally:
+            if clock is not None:
+                clock.exit()
+    return wrapper
+
+# --- HTTP ENDPOINT ---
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line.decode(errors="ignore").split(" ")[1] if request_line else "/"
+        if path.startswith("/metrics"):
+            body, status = registry.render().encode(), "200 OK"
+        else:
+            body, status = b"not found\n", "404 Not Found"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except Exception:
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server(port: int = METRICS_PORT) -> Optional[asyncio.AbstractServer]:
+    """Serves Prometheus text format on 127.0.0.1:`port`/metrics (disabled when port is 0)."""
+    if not port: return None
+    server = await asyncio.start_server(_serve_metrics, "127.0.0.1", port)
+    logger.info(f"Metrics endpoint on http://127.0.0.1:{port}/metrics")
+    return server
@@ -0,0 +1,283 @@
+import os, json, asyncio, logging, time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from core.config import *
+from core.database import db_manager
+from core.embeddings import get_embedder, np
+
+logger = logging.getLogger("SemanticIndex")
+
+def reciprocal_rank_fusion(*rankings: List[int], k: int = 60) -> List[int]:
+    """Merges ranked id lists; ids ranked well by several retrievers float to the top."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+class _Segment:
+    """Growable column store: vectors plus the ids and scope of each row."""
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.guilds = np.zeros(capacity, dtype=np.int64)
+        self.channels = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+
+    def append(self, vectors, ids, guilds, channels):
+        needed = self.size + len(ids)
+        if needed > len(self.ids):
+            capacity = max(needed, len(self.ids) * 2)
+            for name in ("vectors", "ids", "guilds", "channels"):
+                old = getattr(self, name)
+                grown = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                grown[:self.size] = old[:self.size]
+                setattr(self, name, grown)
+        end = self.size + len(ids)
+        self.vectors[self.size:end] = vectors
+        self.ids[self.size:end] = ids
+        self.guilds[self.size:end] = guilds
+        self.channels[self.size:end] = channels
+        self.size = end
+
+class SemanticIndex:
+    """
+    Embeds stored messages as they are written and answers guild-scoped top-k queries.
+    Vectors live in a NumPy store memory-mapped from SEMANTIC_INDEX_DIR (copy-on-write)
+    plus an in-memory tail of new rows that is merged to disk every SEMANTIC_SAVE_EVERY rows.
+    The store records the message id up to which every stored message is indexed, so a
+    restart backfills from there. Search is an exact dot product over the rows in scope,
+    run off the event loop.
+    """
+    FILES = ("vectors", "ids", "guilds", "channels")
+
+    def __init__(self):
+        self.embedder = None
+        self.base: Dict[str, "np.ndarray"] = {}
+        self.tail: Optional[_Segment] = None
+        self.positions: Dict[int, Tuple[str, int]] = {}  # message_id -> (segment, row)
+        self.high_water = 0  # every stored message with a lower or equal id is indexed
+        self._caught_up = False  # backfill done: live rows now arrive in write order
+        self._edited: Optional[set] = None  # ids overwritten while a save is writing
+        self._pending: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._save_lock = asyncio.Lock()  # one writer of the .tmp files at a time
+        self._channel_guilds: Dict[int, int] = {}
+        self.unsaved = 0
+        self.stats_data = {"embedded": 0, "searches": 0, "last_search_ms": 0.0, "backfilled": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.embedder is not None
+
+    def start(self, channel_guilds: Dict[int, int]):
+        """Loads the on-disk index, then backfills and follows new messages in the background."""
+        self._channel_guilds = channel_guilds
+        if self._worker or not SEMANTIC_SEARCH: return
+        self.embedder = get_embedder()
+        if not self.enabled:
+            logger.warning("Semantic search disabled: NumPy is not installed (see requirements.txt).")
+            return
+        self._load()
+        db_manager.add_ingest_listener(self._on_ingest)
+        self._worker = asyncio.create_task(self._run())
+
+    # --- STORAGE ---
+
+    def _path(self, name: str, ext: str = "npy") -> str:
+        return os.path.join(SEMANTIC_INDEX_DIR, f"{name}.{ext}")
+
+    def _load(self):
+        self.tail = _Segment(self.embedder.dim)
+        try:
+            base = {name: np.load(self._path(name), mmap_mode="c") for name in self.FILES}
+            if base["vectors"].shape[1] != self.embedder.dim:
+                logger.warning("Semantic index on disk has a different dimension; rebuilding.")
+                return
+            self.base = base
+            self.positions = {int(m): ("base", i) for i, m in enumerate(base["ids"])}
+            try:
+                with open(self._path("meta", "json")) as f:
+                    self.high_water = int(json.load(f)["high_water"])
+            except FileNotFoundError:
+                # Stores written before the mark existed: resume from their newest row
+                self.high_water = max(self.positions, default=0)
+            logger.info(f"Semantic index loaded ({len(self.positions)} vectors, through id {self.high_water}).")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Semantic Index Load Error: {e}")
+
+    def _save(self, base: Dict[str, "np.ndarray"], tail: Dict[str, "np.ndarray"], high_water: int):
+        """Writes base + tail snapshot as the new on-disk store (runs in a thread)."""
+        os.makedirs(SEMANTIC_INDEX_DIR, exist_ok=True)
+        for name in self.FILES:
+            parts = ([base[name]] if base else []) + [tail[name]]
+            tmp = self._path(name) + ".tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, np.concatenate(parts))
+            os.replace(tmp, self._path(name))
+        # Written last: a crash in between only makes the next start re-embed a little
+        tmp = self._path("meta", "json") + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"high_water": high_water}, f)
+        os.replace(tmp, self._path("meta", "json"))
+
+    async def save(self):
+        async with self._save_lock:
+            await self._save_locked()
+
+    async def _save_locked(self):
+        if not self.enabled or not self.tail or not self.unsaved: return
+        # Snapshot the tail now; rows appended or edited while the thread writes are
+        # applied to the reloaded store afterwards
+        size = self.tail.size
+        tail = {name: getattr(self.tail, name)[:size].copy() for name in self.FILES}
+        self._edited = set()
+        try:
+            job = asyncio.ensure_future(asyncio.to_thread(self._save, self.base, tail, self.high_water))
+            try:
+                await asyncio.shield(job)
+            except asyncio.CancelledError:
+                # The thread can't be stopped: keep the lock until it has finished writing
+                await asyncio.wait([job])
+                raise
+            old_base, carry, old_positions, edited = self.base, self.tail, self.positions, self._edited
+            self._edited = None
+            self.base = {name: np.load(self._path(name), mmap_mode="c") for name in self.FILES}
+            self.tail = _Segment(self.embedder.dim)
+            self.positions = {int(m): ("base", i) for i, m in enumerate(self.base["ids"])}
+            self.unsaved = 0
+            if carry.size > size:
+                self._append(carry.vectors[size:carry.size], carry.ids[size:carry.size],
+                             carry.guilds[size:carry.size], carry.channels[size:carry.size])
+            stale = [m for m in edited if old_positions[m][0] == "base" or old_positions[m][1] < size]
+            if stale:
+                rows = [old_positions[m] for m in stale]
+                column = lambda name: np.stack([(old_base[name] if seg == "base" else getattr(carry, name))[row]
+                                                for seg, row in rows])
+                self._append(column("vectors"), stale, column("guilds"), column("channels"))
+        except Exception as e:
+            logger.error(f"Semantic Index Save Error: {e}")
+        finally:
+            self._edited = None
+
+    # --- INGEST ---
+
+    def _on_ingest(self, rows: List[tuple]):
+        """Database ingest listener: (msg_id, channel_id, author_id, author_name, content, created_at, guild_id)."""
+        for r in rows:
+            self._pending.append((r[0], r[1], r[6], r[4]))
+        self._wakeup.set()
+
+    def _append(self, vectors, ids, guilds, channels):
+        for i, message_id in enumerate(ids):
+            where = self.positions.get(int(message_id))
+            if where is None: continue
+            # Edited message (e.g. a streamed reply) or late guild id: overwrite in place
+            segment, row = where
+            for name, values in (("vectors", vectors), ("guilds", guilds), ("channels", channels)):
+                (self.base[name] if segment == "base" else getattr(self.tail, name))[row] = values[i]
+            self.unsaved += 1
+            if self._edited is not None:
+                self._edited.add(int(message_id))
+        fresh = [i for i, m in enumerate(ids) if int(m) not in self.positions]
+        if not fresh: return
+        start = self.tail.size
+        self.tail.append(vectors[fresh], np.asarray(ids)[fresh], np.asarray(guilds)[fresh], np.asarray(channels)[fresh])
+        for offset, i in enumerate(fresh):
+            self.positions[int(ids[i])] = ("tail", start + offset)
+        self.unsaved += len(fresh)
+
+    async def _embed_rows(self, rows: List[tuple]):
+        rows = [r for r in rows if r[3]]
+        if not rows: return
+        vectors = await asyncio.to_thread(self.embedder.embed, [r[3] for r in rows])
+        self._append(vectors, [r[0] for r in rows],
+                     [r[2] or self._channel_guilds.get(r[1], 0) for r in rows], [r[1] for r in rows])
+        self.stats_data["embedded"] += len(rows)
+        if self.unsaved >= SEMANTIC_SAVE_EVERY:
+            await self.save()
+
+    async def _backfill(self):
+        """Embeds stored messages past the high-water mark (message ids grow over time)."""
+        while True:
+            rows = await db_manager.get_messages_after(self.high_water, SEMANTIC_BATCH_SIZE)
+            if not rows: break
+            await self._embed_rows([(r['message_id'], r['channel_id'], r['guild_id'], r['content']) for r in rows])
+            self.stats_data["backfilled"] += len(rows)
+            self.high_water = rows[-1]['message_id']
+        self._caught_up = True
+        await self.save()
+
+    async def _run(self):
+        try:
+            await self._backfill()
+        except Exception as e:
+            logger.error(f"Semantic Backfill Error: {e}")
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(len(self._pending), SEMANTIC_BATCH_SIZE))]
+                try:
+                    await self._embed_rows(batch)
+                    if self._caught_up:
+                        # Everything written before this batch has been embedded
+                        self.high_water = max(self.high_water, max(r[0] for r in batch))
+                except Exception as e:
+                    logger.error(f"Semantic Embed Error: {e}")
+
+    # --- QUERY ---
+
+    @staticmethod
+    def _top_k(vectors, ids, mask, query, k: int):
+        rows = np.flatnonzero(mask)
+        if not len(rows): return []
+        scores = vectors[rows] @ query
+        keep = scores >= SEMANTIC_MIN_SCORE
+        rows, scores = rows[keep], scores[keep]
+        if len(rows) > k:
+            best = np.argpartition(-scores, k)[:k]
+            rows, scores = rows[best], scores[best]
+        return [(float(s), int(ids[r])) for s, r in zip(scores, rows)]
+
+    def _search(self, query_text: str, guild_id: Optional[int], channel_id: Optional[int], k: int,
+                segments: List[tuple]) -> List[int]:
+        query = self.embedder.embed([query_text])[0]
+        hits = []
+        for vectors, ids, guilds, channels in segments:
+            mask = (guilds == guild_id) if guild_id else (channels == channel_id)
+            hits += self._top_k(vectors, ids, mask, query, k)
+        hits.sort(reverse=True)
+        return [message_id for _, message_id in hits[:k]]
+
+    async def search(self, query: str, guild_id: Optional[int], channel_id: Optional[int] = None, k: int = SEMANTIC_TOP_K) -> List[int]:
+        """Message ids most similar to `query` within the guild (or the DM channel)."""
+        if not self.enabled or not (guild_id or channel_id): return []
+        size = self.tail.size
+        segments = [(self.tail.vectors[:size], self.tail.ids[:size], self.tail.guilds[:size], self.tail.channels[:size])]
+        if self.base:
+            segments.append(tuple(self.base[name] for name in self.FILES))
+        start = time.perf_counter()
+        try:
+            return await asyncio.to_thread(self._search, query, guild_id, channel_id, k, segments)
+        except Exception as e:
+            logger.error(f"Semantic Search Error: {e}")
+            return []
+        finally:
+            self.stats_data["searches"] += 1
+            self.stats_data["last_search_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    async def close(self):
+        if self._worker:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        await self.save()
+
+    def stats(self) -> Dict[str, float]:
+        return {**self.stats_data, "vectors": len(self.positions), "pending": len(self._pending)}
+
+semantic_index = SemanticIndex()
@@ -1,88 +1,222 @@
-import os, asyncio, time, logging, discord
-from agno.media import Image
+import asyncio, time, inspect, logging, discord
+from agno.run.agent import RunOutput
+from typing import Callable, Dict, List, Optional
 from core.config import *
 from core.database import db_manager
-from core.execution_context import set_current_channel
-from agent.agent_factory import create_hero_agent
+from core.execution_context import set_current_channel, set_current_query
+from core.metrics import trace_turn, current_turn, span, tool_clock, ToolClock
+from agent.agent_factory import agent_pool
+from agent.context_budget import log_turn_tokens
+from agent.prompt_layout import stable_instructions, build_turn_context, prefix_cache_stats
+from agent.memory_worker import memory_worker
+from agent.channel_summarizer import channel_summarizer
+from agent.key_pool import key_pool, KeyState, looks_rate_limited
+from agent.model_router import model_router
 from discord_bot.discord_utils import resolve_mentions, restore_mentions
-from discord_bot.context_cache import build_history_string
+from discord_bot.context_cache import build_history_string, context_cache
+from discord_bot.reply_streamer import ReplyStreamer
+from discord_bot.image_pipeline import image_pipeline
+from discord_bot.worker_pool import worker_pool
 
 logger = logging.getLogger("ChatHandler")
-FAILED_KEYS = {}
 
-def is_blacklisted(key):
-    if key in FAILED_KEYS and time.time() - FAILED_KEYS[key] < KEY_COOLDOWN:
-        return True
-    return False
+async def _stream_run(agent, prompt, user_id, images, streamer: ReplyStreamer):
+    """Feeds the agent's content deltas into `streamer` as they are generated."""
+    run = agent.arun(prompt, user_id=user_id, images=images, stream=True, yield_run_output=True)
+    if inspect.isawaitable(run):
+        run = await run
+    async for event in run:
+        if isinstance(event, RunOutput):
+            # The final output of the run; its content repeats the deltas, its metrics do not
+            streamer.run_output = event
+            continue
+        content = getattr(event, "content", None)
+        if not isinstance(content, str): continue
+        # Only plain content events carry reply text; tool / status events are skipped
+        if getattr(event, "event", "RunResponseContent") not in ("RunResponseContent", "RunContent"): continue
+        await streamer.push(content)
 
-async def handle_chat(message: discord.Message, bot: discord.Client, bio_tools):
+def _extract_prompt(message: discord.Message) -> str:
+    prompt = resolve_mentions(message)
+    if prompt.startswith(PREFIX):
+        prompt = prompt[len(PREFIX):].strip()
+    return prompt
+
+def _coalesce_prompts(burst: List[discord.Message]) -> str:
+    """Merges a burst of prompts from one channel into a single turn."""
+    parts = [(m, _extract_prompt(m)) for m in burst]
+    parts = [(m, p) for m, p in parts if p]
+    if len({m.author.id for m, _ in parts}) <= 1:
+        return "\n".join(p for _, p in parts)
+    return "\n".join(f"{m.author.display_name}({m.author.id}): {p}" for m, p in parts)
+
+def _author_prompts(burst: List[discord.Message]) -> List[tuple]:
+    """(user_id, prompt) per message, so memories from a merged turn go to the right author."""
+    return [(str(m.author.id), _extract_prompt(m)) for m in burst]
+
+async def generate_reply(prompt: str, history_str: str, images, user_id: str, user_memories: List[str], bio_tools,
+                         streamer_factory: Optional[Callable[[], ReplyStreamer]] = None):
+    """
+    The agent part of a turn: picks keys from the pool (hedged when enabled) and runs the
+    agent. Returns the started ReplyStreamer when streaming, else the run response, or
+    None when every key failed. Runs in the gateway or in an agent worker process.
+    """
+    route = model_router.classify(prompt, bool(images))
+    # Tool time per key attempt: kept out of the key's latency and used to hold back hedges
+    clocks: Dict[str, ToolClock] = {}
+
+    async def run_on_key(state: KeyState):
+        """One attempt on one key; returns the response/streamer, or None on failure."""
+        m_id = model_router.model_for(route, state.is_openrouter)
+
+        streamer = streamer_factory() if streamer_factory else None
+        key_pool.begin(state)
+        try:
+            async with agent_pool.acquire(
+                state.key, history_str, 
+                model_id=m_id, 
+                is_openrouter=state.is_openrouter, 
+                bio_tools=bio_tools,
+                user_id=user_id,
+                user_memories=user_memories
+            ) as agent:
+                with span("llm", key=state.name, stream=str(bool(streamer)).lower()), tool_clock() as clock:
+                    clocks[state.name] = clock
+                    start = time.perf_counter()
+                    if streamer:
+                        await _stream_run(agent, prompt, user_id, images if images else None, streamer)
+                    else:
+                        response = await agent.arun(prompt, user_id=user_id, images=images if images else None, stream=False)
+                    # Only the model's share of the run rates the key; tools are not its latency
+                    latency = max(time.perf_counter() - start - clock.seconds, 0.0)
+        except asyncio.CancelledError:
+            key_pool.release(state)
+            raise
+        except Exception as e:
+            logger.error(f"Error on {state.name}: {e}")
+            key_pool.record_failure(state, error=e)
+            model_router.record(route, m_id, None, ok=False)
+            # A half-streamed reply cannot be retried on another key
+            return streamer if streamer and streamer.started else None
+
+        text = streamer.buffer if streamer else (response.content if response else None)
+        if not text or not text.strip():
+            key_pool.record_failure(state)
+            model_router.record(route, m_id, None, ok=False)
+            return None
+        # Handle specific API rate limit strings (only while nothing has reached Discord yet)
+        if looks_rate_limited(text) and not (streamer and streamer.started):
+            key_pool.record_failure(state, rate_limited=True)
+            model_router.record(route, m_id, None, ok=False)
+            return None
+        key_pool.record_success(state, latency)
+        model_router.record(route, m_id, latency, ok=True)
+        return streamer or response
+
+    result = None
+    while route is not None:
+        candidates = key_pool.candidates()
+        if candidates and not streamer_factory and key_pool.hedge_delay(candidates[0]) is not None:
+            result = await key_pool.run_hedged(candidates, run_on_key,
+                                               may_hedge=lambda s: not (s.name in clocks and clocks[s.name].started))
+        else:
+            for state in candidates:
+                result = await run_on_key(state)
+                if result is not None: break
+        # The small model failed everywhere: escalate once before giving up
+        route = model_router.escalate(route) if result is None else None
+
+    if result is not None:
+        # Streamed turns are measured from the run's final output
+        response = result.run_output if isinstance(result, ReplyStreamer) else result
+        log_turn_tokens({
+            "stable_prefix": stable_instructions(),
+            "turn_context": build_turn_context(history_str, user_memories),
+            "prompt": prompt
+        }, response)
+        if response is not None:
+            prefix_cache_stats.observe(response)
+    return result
+
+async def handle_chat(message: discord.Message, bot: discord.Client, bio_tools, burst: Optional[List[discord.Message]] = None):
+    """Runs one chat turn replying to `message`; `burst` holds every prompt merged into it."""
+    with trace_turn(channel_id=message.channel.id, message_id=message.id, prompts=len(burst or [message])):
+        await _handle_chat(message, bot, bio_tools, burst)
+
+async def _handle_chat(message: discord.Message, bot: discord.Client, bio_tools, burst: Optional[List[discord.Message]]):
     try:
-        set_current_channel(message)
+        set_current_channel(message.channel)
         
         # Human-like 'Thinking' status
         async with message.channel.typing():
-            prompt = resolve_mentions(message)
-            if prompt.startswith(PREFIX):
-                prompt = prompt[len(PREFIX):].strip()
+            prompt = _coalesce_prompts(burst) if burst and len(burst) > 1 else _extract_prompt(message)
 
             if not prompt: return
+            set_current_query(prompt)
+            # Only channels the bot converses in get rolling summaries
+            channel_summarizer.activate(message.channel.id)
 
             # 1. Build context from recent logs
-            history_str = await build_history_string(message.channel.id, bot.user.id)
+            with span("history"):
+                history_str = await build_history_string(message.channel.id, bot.user.id)
 
-            images = [Image(url=a.url) for a in message.attachments if a.content_type and "image" in a.content_type]
+            with span("images"):
+                images = await image_pipeline.prepare(message.attachments)
 
-            keys = [
-                (os.getenv("GROQ_API_KEY_1"), False, "Groq-1"),
-                (os.getenv("GROQ_API_KEY_2"), False, "Groq-2"),
-                (os.getenv("OPENROUTER_API_KEY"), True, "OpenRouter")
-            ]
+            user_id = str(message.author.id)
+            with span("memory_recall"):
+                user_memories = await memory_worker.recall(user_id)
 
-            response = None
-            for key, is_or, name in keys:
-                if not key or is_blacklisted(key): continue
-                
-                # FIX: Explicitly determine model IDs to avoid undefined variable errors
-                if images:
-                    m_id = GROQ_VISION_MODEL
-                else:
-                    m_id = OPENROUTER_MODEL if is_or else GROQ_MODEL
-
-                try:
-                    agent = create_hero_agent(
-                        key, history_str, 
-                        model_id=m_id, 
-                        is_openrouter=is_or, 
-                        bio_tools=bio_tools
+            streamer, reply_text = None, None
+            if worker_pool.enabled:
+                # Multi-process mode: the agent runs in a worker; only the reply text comes back
+                with span("worker"):
+                    reply_text = await worker_pool.run_turn(message, {
+                        "prompt": prompt, "history": history_str, "images": images,
+                        "user_id": user_id, "user_memories": user_memories
+                    })
+            else:
+                result = await generate_reply(
+                    prompt, history_str, images, user_id, user_memories, bio_tools,
+                    streamer_factory=(lambda: ReplyStreamer(message)) if STREAM_REPLIES else None
+                )
+                streamer = result if isinstance(result, ReplyStreamer) else None
+                reply_text = result.content if result is not None and not streamer else None
+
+            if not streamer and not reply_text:
+                current_turn()["outcome"] = "no_reply"
+
+            if streamer:
+                with span("reply"):
+                    sent = await streamer.finish()
+                if sent:
+                    # Store the final text once, after the last edit
+                    final = restore_mentions(streamer.buffer)
+                    context_cache.record_message(sent.channel.id, sent.id, sent.author.id, "Hero", final)
+                    await db_manager.store_message(
+                        sent.id, sent.channel.id, sent.author.id,
+                        "Hero", final, sent.created_at, guild_id=sent.guild.id if sent.guild else None
                     )
-                    
-                    response = await agent.arun(prompt, user_id=str(message.author.id), images=images if images else None)
-                    
-                    if response and response.content:
-                        text = response.content.lower()
-                        # Handle specific API rate limit strings
-                        if any(x in text for x in ["rate limit", "429", "quota exceeded"]):
-                            logger.warning(f"Key {name} rate limited.")
-                            FAILED_KEYS[key] = time.time()
-                            continue
-                        break
-                except Exception as e:
-                    logger.error(f"Error on {name}: {e}")
-                    continue
-            
-            if response and response.content:
-                final = restore_mentions(response.content)
+                    memory_worker.submit_burst(_author_prompts(burst or [message]), final)
+            elif reply_text:
+                final = restore_mentions(reply_text)
                 
                 # Human typing simulation delay
-                await asyncio.sleep(min(len(final) * 0.02, 2.0)) 
+                with span("typing_delay"):
+                    await asyncio.sleep(min(len(final) * 0.02, 2.0)) 
                 
-                sent = await message.reply(final, mention_author=False)
+                with span("reply"):
+                    sent = await message.reply(final, mention_author=False)
                 
                 # Save Hero's own thoughts to memory
+                context_cache.record_message(sent.channel.id, sent.id, sent.author.id, "Hero", sent.content)
                 await db_manager.store_message(
                     sent.id, sent.channel.id, sent.author.id, 
-                    "Hero", sent.content, sent.created_at
+                    "Hero", sent.content, sent.created_at, guild_id=sent.guild.id if sent.guild else None
                 )
+                # Memory extraction happens in the background, after the user has the reply
+                memory_worker.submit_burst(_author_prompts(burst or [message]), final)
 
     except Exception as e:
+        current_turn()["outcome"] = "error"
         logger.exception(e)
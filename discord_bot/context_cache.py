@@ -1,19 +1,118 @@
-import logging
+import time, logging
+from collections import OrderedDict, deque
+from typing import Optional
 from core.database import db_manager
-from core.config import MAX_HISTORY
+from core.config import MAX_HISTORY, CONTEXT_CACHE_CHANNELS, CONTEXT_CACHE_IDLE, HISTORY_TOKEN_BUDGET, SUMMARY_MAX_BATCH
+from agent.context_budget import estimate_tokens, keep_recent_lines
+from agent.channel_summarizer import channel_summarizer
 
 logger = logging.getLogger("ContextCache")
 
+class _ChannelHistory:
+    __slots__ = ("messages", "loaded", "rendered", "summary_cutoff", "last_used")
+
+    def __init__(self):
+        self.messages = deque(maxlen=MAX_HISTORY)  # chronological dicts
+        self.loaded = False  # True once the DB backlog has been merged in
+        self.rendered: Optional[str] = None
+        self.summary_cutoff = 0  # last message id covered by the summary in `rendered`
+        self.last_used = time.monotonic()
+
+class ContextCache:
+    """
+    Per-channel ring buffer of the last MAX_HISTORY messages, fed by on_message and by
+    Hero's own replies. Postgres is only read on a cold miss; the formatted history
+    string is memoized until a new message lands in that channel or its rolling summary
+    moves; messages the summary covers are left out of the raw part, and messages it does
+    not cover yet that fell out of the buffer are read back from Postgres. Idle channels are
+    evicted LRU-first once CONTEXT_CACHE_CHANNELS is exceeded or after CONTEXT_CACHE_IDLE.
+    """
+    def __init__(self, max_channels: int = CONTEXT_CACHE_CHANNELS, idle_ttl: float = CONTEXT_CACHE_IDLE):
+        self.max_channels = max_channels
+        self.idle_ttl = idle_ttl
+        self._channels: "OrderedDict[int, _ChannelHistory]" = OrderedDict()
+        self.hits = 0
+        self.cold_misses = 0
+        self.gap_fills = 0
+
+    def _entry(self, channel_id: int) -> _ChannelHistory:
+        entry = self._channels.get(channel_id)
+        if entry is None:
+            entry = self._channels[channel_id] = _ChannelHistory()
+        self._channels.move_to_end(channel_id)
+        entry.last_used = time.monotonic()
+        self._evict()
+        return entry
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._channels:
+            channel_id, oldest = next(iter(self._channels.items()))
+            if len(self._channels) <= self.max_channels and oldest.last_used >= cutoff:
+                break
+            del self._channels[channel_id]
+
+    def record_message(self, channel_id: int, message_id: int, author_id: int, author_name: str, content: str):
+        """Appends a message (or updates it in place, e.g. a streamed reply's final edit)."""
+        if not content: return
+        entry = self._entry(channel_id)
+        for msg in entry.messages:
+            if msg['message_id'] == message_id:
+                msg['content'] = content
+                break
+        else:
+            entry.messages.append({
+                'message_id': message_id, 'author_id': author_id,
+                'author_name': author_name, 'content': content
+            })
+        entry.rendered = None
+
+    async def build_history_string(self, channel_id: int, bot_id: int) -> str:
+        entry = self._entry(channel_id)
+        if not entry.loaded:
+            self.cold_misses += 1
+            rows = await db_manager.get_messages(channel_id, limit=MAX_HISTORY)
+            # Merge with anything recorded while cold; snowflake IDs sort chronologically
+            merged = {r['message_id']: r for r in rows}
+            merged.update({m['message_id']: m for m in entry.messages})
+            entry.messages = deque((merged[k] for k in sorted(merged)), maxlen=MAX_HISTORY)
+            entry.loaded = True
+            entry.rendered = None
+        else:
+            self.hits += 1
+
+        summary = await channel_summarizer.get(channel_id)
+        cutoff = summary['last_message_id'] if summary else 0
+        if entry.rendered is None or entry.summary_cutoff != cutoff:
+            messages = list(entry.messages)
+            if summary and messages and messages[0]['message_id'] > cutoff:
+                # The summary lags the buffer (e.g. during a burst): fill the gap between them
+                self.gap_fills += 1
+                gap = await db_manager.get_channel_messages_between(
+                    channel_id, cutoff, messages[0]['message_id'], limit=SUMMARY_MAX_BATCH)
+                messages = gap + messages
+            lines = []
+            for msg in messages:
+                if msg['message_id'] <= cutoff: continue
+                # If it's the bot, call it "Hero". If it's the user, use their real name (e.g. Forbit)
+                role = "Hero" if msg['author_id'] == bot_id else msg['author_name']
+                lines.append(f"{role}: {msg['content']}")
+            if not lines and not summary:
+                return "No previous conversation found."
+            rendered = "\n".join(lines)
+            if summary:
+                # Trim the raw part here so the budget cut downstream never drops the summary
+                header = f"Summary of the earlier conversation:\n{summary['summary']}\n\nRecent messages:\n"
+                rendered = header + keep_recent_lines(rendered, max(HISTORY_TOKEN_BUDGET - estimate_tokens(header), 0))
+            entry.rendered, entry.summary_cutoff = rendered, cutoff
+        return entry.rendered
+
+    def stats(self):
+        return {"channels": len(self._channels), "hits": self.hits, "cold_misses": self.cold_misses,
+                "gap_fills": self.gap_fills}
+
+context_cache = ContextCache()
+
 async def build_history_string(channel_id: int, bot_id: int) -> str:
-    """Builds a formatted history string from the DB using Real Names."""
-    history = await db_manager.get_messages(channel_id, limit=MAX_HISTORY)
-    if not history:
-        return "No previous conversation found."
-    
-    lines = []
-    for msg in reversed(history):
-        # If it's the bot, call it "Hero". If it's the user, use their real name (e.g. Forbit)
-        role = "Hero" if msg['author_id'] == bot_id else msg['author_name']
-        lines.append(f"{role}: {msg['content']}")
-    
-    return "\n".join(lines)
+    """Builds a formatted history string (oldest first) using Real Names."""
+    return await context_cache.build_history_string(channel_id, bot_id)
@@ -24,3 +24,21 @@ def restore_mentions(response):
         return ""
     pattern = r"@([^\(\)<>]+?)\s*\((\d+)\)"
     return re.sub(pattern, lambda m: f"<@{m.group(2)}>", response)
+
+_MENTION_PREFIX = re.compile(r"@([^\(\)<>]+?)\s*\((\d+)\)")
+_MAX_MENTION_LEN = 64  # "@" + display name (<= 32) + " (" + snowflake + ")"
+
+def stream_safe_text(partial):
+    """
+    Returns the part of a still-streaming response that can be rendered right now.
+    A trailing `@Name(ID` that may still be completed by the next chunk is held back,
+    so restore_mentions never sees half a mention.
+    """
+    if not partial:
+        return ""
+    at = partial.rfind("@")
+    if at != -1:
+        tail = partial[at:]
+        if len(tail) <= _MAX_MENTION_LEN and not _MENTION_PREFIX.match(tail):
+            partial = partial[:at]
+    return restore_mentions(partial)
@@ -0,0 +1,81 @@
+import io, asyncio, hashlib, logging
+from typing import List, Optional, Tuple
+from agno.media import Image
+from core.cache import TTLCache
+from core.config import *
+
+# Pillow is optional; without it attachments are passed through by URL as before
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
+logger = logging.getLogger("ImagePipeline")
+
+def _downscale(raw: bytes) -> bytes:
+    """Fits the image inside IMAGE_MAX_SIDE and re-encodes it as JPEG (runs in a thread)."""
+    with PILImage.open(io.BytesIO(raw)) as img:
+        img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+        return out.getvalue()
+
+class ImagePipeline:
+    """
+    Fetches image attachments concurrently, downscales and re-encodes them, dedupes by
+    content hash and keeps processed images in a bounded LRU, so the vision model gets
+    compact inline images instead of full-resolution URLs.
+    """
+    def __init__(self):
+        self._by_source = TTLCache(IMAGE_CACHE_SIZE, IMAGE_CACHE_TTL)  # attachment url -> content hash
+        self._by_hash = TTLCache(IMAGE_CACHE_SIZE, IMAGE_CACHE_TTL)    # content hash -> jpeg bytes
+        self._fetch_slots = asyncio.Semaphore(IMAGE_FETCH_CONCURRENCY)
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def _process(self, attachment) -> Optional[Tuple[str, bytes]]:
+        digest = self._by_source.get(attachment.url)
+        if digest is not None:
+            data = self._by_hash.get(digest)
+            if data is not None:
+                return digest, data
+        if getattr(attachment, "size", 0) > IMAGE_MAX_DOWNLOAD_BYTES:
+            return None
+        async with self._fetch_slots:
+            raw = await attachment.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        self._by_source.set(attachment.url, digest)
+        data = self._by_hash.get(digest)
+        if data is None:
+            data = await asyncio.to_thread(_downscale, raw)
+            self._by_hash.set(digest, data)
+            self.bytes_in += len(raw)
+            self.bytes_out += len(data)
+        return digest, data
+
+    async def prepare(self, attachments) -> List[Image]:
+        image_attachments = [a for a in attachments if a.content_type and "image" in a.content_type]
+        if not image_attachments: return []
+        if PILImage is None:
+            return [Image(url=a.url) for a in image_attachments]
+
+        results = await asyncio.gather(*(self._process(a) for a in image_attachments), return_exceptions=True)
+        images, seen = [], set()
+        for attachment, result in zip(image_attachments, results):
+            if isinstance(result, BaseException) or result is None:
+                if isinstance(result, BaseException):
+                    logger.warning(f"Image preprocessing failed, sending URL instead: {result}")
+                images.append(Image(url=attachment.url))
+                continue
+            digest, data = result
+            if digest in seen: continue
+            seen.add(digest)
+            images.append(Image(content=data, format="jpeg"))
+        return images
+
+    def stats(self):
+        return {"cache": self._by_hash.stats(), "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
+image_pipeline = ImagePipeline()
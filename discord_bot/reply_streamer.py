@@ -0,0 +1,68 @@
+import asyncio, time, logging, discord
+from typing import Optional
+from core.config import STREAM_EDIT_INTERVAL, STREAM_FIRST_CHUNK_CHARS
+from agent.key_pool import looks_rate_limited
+from discord_bot.discord_utils import restore_mentions, stream_safe_text
+
+logger = logging.getLogger("ReplyStreamer")
+
+class ReplyStreamer:
+    """
+    Turns a stream of text deltas into one Discord reply: the first chunk is sent as
+    soon as it is ready, later text lands through edits throttled to STREAM_EDIT_INTERVAL.
+    """
+    def __init__(self, message: discord.Message):
+        self.message = message
+        self.buffer = ""
+        self.sent: Optional[discord.Message] = None
+        self._shown = ""
+        self._last_edit = 0.0
+        self.run_output = None  # the finished agent run, for its usage metrics
+
+    @property
+    def started(self) -> bool:
+        return self.sent is not None
+
+    def looks_rate_limited(self) -> bool:
+        return looks_rate_limited(self.buffer)
+
+    async def push(self, delta: str):
+        self.buffer += delta
+        if not self.sent:
+            # Hold the first message until it is long enough to tell a real answer
+            # from a provider error that should fall back to the next key.
+            if len(self.buffer) < STREAM_FIRST_CHUNK_CHARS or self.looks_rate_limited():
+                return
+            text = stream_safe_text(self.buffer)
+            if text.strip():
+                self.sent = await self.message.reply(text, mention_author=False)
+                self._shown = text
+                self._last_edit = time.monotonic()
+        elif time.monotonic() - self._last_edit >= STREAM_EDIT_INTERVAL:
+            await self._edit(stream_safe_text(self.buffer))
+
+    async def _edit(self, text: str):
+        if not text.strip() or text == self._shown: return
+        try:
+            await self.sent.edit(content=text)
+            self._shown = text
+        except discord.HTTPException as e:
+            logger.warning(f"Stream edit failed: {e}")
+        self._last_edit = time.monotonic()
+
+    async def finish(self) -> Optional[discord.Message]:
+        """Renders the complete text (short replies that never streamed are sent here)."""
+        final = restore_mentions(self.buffer)
+        if not final.strip():
+            return self.sent
+        if not self.sent:
+            self.sent = await self.message.reply(final, mention_author=False)
+            self._shown = final
+        elif final != self._shown:
+            # The final edit keeps the cadence too, so a reply that ends right after
+            # its first chunk is not sent and edited back to back.
+            wait = STREAM_EDIT_INTERVAL - (time.monotonic() - self._last_edit)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self._edit(final)
+        return self.sent
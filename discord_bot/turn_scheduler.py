@@ -0,0 +1,74 @@
+import time, asyncio, logging, discord
+from collections import deque
+from typing import Dict, List, Tuple
+from core.config import MAX_CONCURRENT_TURNS, TURN_COALESCE_WINDOW, CHANNEL_QUEUE_LIMIT, TURN_MAX_WAIT
+from discord_bot.chat_handler import handle_chat
+
+logger = logging.getLogger("TurnScheduler")
+
+class TurnScheduler:
+    """
+    Serializes chat turns per channel and caps in-flight turns globally.
+    Prompts that pile up in a channel while a turn is queued or running are merged
+    into the next turn. Load is shed in two places: a channel keeps at most
+    CHANNEL_QUEUE_LIMIT pending prompts (oldest dropped), and a turn that waits
+    longer than TURN_MAX_WAIT for a global slot is dropped.
+    """
+    def __init__(self):
+        self._queues: Dict[int, List[Tuple[discord.Message, float]]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._slots = asyncio.Semaphore(MAX_CONCURRENT_TURNS)
+        self.wait_times = deque(maxlen=500)  # seconds from first prompt to turn start
+        self.turns = 0
+        self.coalesced = 0
+        self.shed = 0
+        self.in_flight = 0
+
+    def submit(self, message: discord.Message, bot: discord.Client, bio_tools):
+        channel_id = message.channel.id
+        queue = self._queues.setdefault(channel_id, [])
+        if len(queue) >= CHANNEL_QUEUE_LIMIT:
+            queue.pop(0)
+            self.shed += 1
+            logger.warning(f"Channel {channel_id} over {CHANNEL_QUEUE_LIMIT} pending prompts; dropped the oldest.")
+        queue.append((message, time.monotonic()))
+        if channel_id not in self._workers:
+            self._workers[channel_id] = asyncio.create_task(self._run_channel(channel_id, bot, bio_tools))
+
+    async def _run_channel(self, channel_id: int, bot: discord.Client, bio_tools):
+        try:
+            while self._queues.get(channel_id):
+                # Give a burst of prompts a moment to land so they become one turn
+                await asyncio.sleep(TURN_COALESCE_WINDOW)
+                try:
+                    await asyncio.wait_for(self._slots.acquire(), timeout=TURN_MAX_WAIT)
+                except asyncio.TimeoutError:
+                    dropped = self._queues.pop(channel_id, [])
+                    self.shed += len(dropped)
+                    logger.warning(f"Shed {len(dropped)} prompt(s) in {channel_id}: no slot within {TURN_MAX_WAIT}s.")
+                    continue
+                # Everything queued up to the moment we got a slot joins this turn
+                burst = self._queues.pop(channel_id, [])
+                if not burst:
+                    self._slots.release()
+                    continue
+                self.wait_times.append(time.monotonic() - burst[0][1])
+                self.turns += 1
+                self.coalesced += len(burst) - 1
+                self.in_flight += 1
+                try:
+                    await handle_chat(burst[-1][0], bot, bio_tools, burst=[m for m, _ in burst])
+                finally:
+                    self.in_flight -= 1
+                    self._slots.release()
+        finally:
+            self._workers.pop(channel_id, None)
+
+    def stats(self) -> Dict[str, object]:
+        waits = sorted(self.wait_times)
+        pct = lambda q: round(waits[min(len(waits) - 1, int(q * len(waits)))], 3) if waits else 0.0
+        return {"turns": self.turns, "coalesced": self.coalesced, "shed": self.shed,
+                "in_flight": self.in_flight, "queued": sum(len(q) for q in self._queues.values()),
+                "wait_p50_s": pct(0.5), "wait_p95_s": pct(0.95)}
+
+turn_scheduler = TurnScheduler()
@@ -0,0 +1,242 @@
+import time, asyncio, logging, itertools
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set
+from core.config import *
+
+logger = logging.getLogger("WorkerPool")
+
+class WorkerHandle:
+    """Gateway-side view of one agent worker process."""
+    def __init__(self, index: int, ctx, outbox):
+        self.index = index
+        self.inbox = ctx.Queue()
+        self.process = ctx.Process(target=_worker_entry, args=(index, self.inbox, outbox),
+                                   name=f"agent-worker-{index}", daemon=True)
+        self.in_flight: Dict[int, asyncio.Future] = {}
+        self.started_at = time.monotonic()
+        self.last_pong = self.started_at
+        self.ready = False
+        self.turns = 0
+        self.failed = 0
+        self.stats: Dict[str, Any] = {}
+
+    @property
+    def healthy(self) -> bool:
+        return self.ready and self.process.is_alive()
+
+def _worker_entry(index: int, inbox, outbox):
+    # Imported in the child only: the gateway never loads the worker's agent stack twice
+    from agent.worker_process import worker_main
+    worker_main(index, inbox, outbox)
+
+class WorkerPool:
+    """
+    Optional multi-process mode (MULTIPROCESS_WORKERS > 0). The gateway keeps Discord,
+    the DB writer and reply delivery; agent runs and tool calls happen in N worker
+    processes fed over multiprocessing queues. Turns stick to a worker per channel when
+    it has room (warm agent pool and caches), each worker takes at most WORKER_MAX_TURNS,
+    and callers wait for capacity instead of queueing unboundedly. Workers are pinged
+    and replaced when they die or stop answering; Discord and semantic-index lookups the
+    tools need are answered by the gateway over the same queues.
+    """
+    def __init__(self):
+        self.workers: List[WorkerHandle] = []
+        self._ctx = mp.get_context("spawn")
+        self._outbox = None
+        self._capacity: Optional[asyncio.Semaphore] = None
+        self._ids = itertools.count(1)
+        self._reader_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="worker-outbox")
+        self._tasks: List[asyncio.Task] = []
+        self._cancels: Set[asyncio.Task] = set()  # turns being stopped; each holds its slot
+        self._rpc_handlers: Dict[str, Any] = {}
+        self.restarts = 0
+        self.capacity_waits = 0
+        self.rpc_calls = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.workers)
+
+    def start(self, bot, lookup, semantic):
+        if self.enabled or MULTIPROCESS_WORKERS <= 0: return
+        self._bot, self._lookup, self._semantic = bot, lookup, semantic
+        self._rpc_handlers = {"get_user": self._rpc_get_user, "get_member": self._rpc_get_member,
+                              "semantic_search": self._rpc_semantic_search}
+        self._outbox = self._ctx.Queue()
+        self._capacity = asyncio.Semaphore(MULTIPROCESS_WORKERS * WORKER_MAX_TURNS)
+        for i in range(MULTIPROCESS_WORKERS):
+            self.workers.append(self._spawn(i))
+        self._tasks = [asyncio.create_task(self._read_outbox()), asyncio.create_task(self._health_loop())]
+        logger.info(f"Started {MULTIPROCESS_WORKERS} agent worker processes.")
+
+    def _spawn(self, index: int) -> WorkerHandle:
+        handle = WorkerHandle(index, self._ctx, self._outbox)
+        handle.process.start()
+        return handle
+
+    # --- TURNS ---
+
+    def _pick(self, channel_id: int) -> Optional[WorkerHandle]:
+        """The channel's home worker when it has room, else the least loaded healthy one."""
+        home = self.workers[channel_id % len(self.workers)]
+        if home.healthy and len(home.in_flight) < WORKER_MAX_TURNS:
+            return home
+        healthy = [w for w in self.workers if w.healthy and len(w.in_flight) < WORKER_MAX_TURNS]
+        return min(healthy, key=lambda w: len(w.in_flight)) if healthy else None
+
+    async def run_turn(self, message, payload: Dict[str, Any]) -> Optional[str]:
+        """Runs one turn's agent work in a worker; returns the reply text (None on failure)."""
+        if self._capacity.locked():
+            self.capacity_waits += 1
+        await self._capacity.acquire()
+        worker = self._pick(message.channel.id)
+        if worker is None:
+            self._capacity.release()
+            logger.error("No healthy agent worker available; dropping turn.")
+            return None
+        turn_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        worker.in_flight[turn_id] = future
+        worker.inbox.put({"op": "turn", "id": turn_id, "payload": {
+            **payload,
+            "images": [{"url": i.url, "content": i.content, "format": i.format} for i in payload.get("images") or []],
+            "message_id": message.id, "channel_id": message.channel.id,
+            "guild_id": message.guild.id if message.guild else None
+        }})
+        stopping = False
+        try:
+            reply = await asyncio.wait_for(asyncio.shield(future), timeout=WORKER_TURN_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # The worker may still be running the turn: it keeps its slot until the worker stops it
+            stopping = True
+            task = asyncio.create_task(self._cancel_turn(worker, turn_id, future))
+            self._cancels.add(task)
+            task.add_done_callback(self._cancels.discard)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            logger.warning(f"Worker {worker.index} did not answer turn {turn_id} within {WORKER_TURN_TIMEOUT}s; cancelling it.")
+            reply = None
+        finally:
+            if not stopping:
+                self._end_turn(worker, turn_id)
+        worker.turns += 1
+        if reply is None:
+            worker.failed += 1
+        return reply
+
+    def _end_turn(self, worker: WorkerHandle, turn_id: int):
+        worker.in_flight.pop(turn_id, None)
+        self._capacity.release()
+
+    async def _cancel_turn(self, worker: WorkerHandle, turn_id: int, future: asyncio.Future):
+        """
+        Asks the worker to stop a turn that timed out or whose caller went away, and keeps
+        its slot until the worker's reply confirms it; a worker that ignores the cancel is
+        restarted, so turns running in workers never exceed the capacity.
+        """
+        worker.inbox.put({"op": "cancel", "id": turn_id})
+        try:
+            await asyncio.wait_for(future, timeout=WORKER_CANCEL_GRACE)
+        except asyncio.TimeoutError:
+            if self.workers[worker.index] is worker:
+                self._restart(worker.index, f"ignored the cancel of turn {turn_id}")
+        finally:
+            self._end_turn(worker, turn_id)
+
+    # --- WORKER -> GATEWAY ---
+
+    async def _read_outbox(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            msg = await loop.run_in_executor(self._reader_pool, self._outbox.get)
+            if msg is None: return  # stop() sentinel
+            try:
+                worker = self.workers[msg["worker"]]
+                op = msg["op"]
+                if op == "ready":
+                    worker.ready = True
+                    worker.last_pong = time.monotonic()
+                elif op == "reply":
+                    future = worker.in_flight.get(msg["id"])
+                    if future and not future.done():
+                        future.set_result(msg.get("text"))
+                elif op == "pong":
+                    worker.last_pong = time.monotonic()
+                    worker.stats = msg.get("stats", {})
+                elif op == "rpc":
+                    asyncio.create_task(self._answer_rpc(worker, msg))
+            except Exception as e:
+                logger.error(f"Bad worker message {msg!r}: {e}")
+
+    async def _answer_rpc(self, worker: WorkerHandle, msg: Dict[str, Any]):
+        self.rpc_calls += 1
+        try:
+            result = await self._rpc_handlers[msg["method"]](*msg.get("args", []))
+            reply = {"op": "rpc_result", "id": msg["id"], "result": result}
+        except Exception as e:
+            reply = {"op": "rpc_result", "id": msg["id"], "error": str(e)}
+        worker.inbox.put(reply)
+
+    async def _rpc_get_user(self, user_id: int) -> Dict[str, Any]:
+        user = await self._lookup.get_user(user_id)
+        avatar = user.avatar.url if user.avatar else user.default_avatar.url
+        return {"id": user.id, "name": user.name, "display_name": user.display_name, "avatar_url": str(avatar)}
+
+    async def _rpc_get_member(self, guild_id: int, user_id: int) -> Dict[str, Any]:
+        guild = self._bot.get_guild(guild_id)
+        if guild is None: raise LookupError(f"Unknown guild {guild_id}")
+        member = await self._lookup.get_member(guild, user_id)
+        return {"id": member.id, "joined_at": member.joined_at.isoformat() if member.joined_at else None}
+
+    async def _rpc_semantic_search(self, query: str, guild_id: Optional[int], channel_id: Optional[int]) -> List[int]:
+        return await self._semantic.search(query, guild_id, channel_id)
+
+    # --- HEALTH ---
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(WORKER_HEALTH_INTERVAL)
+            now = time.monotonic()
+            for i, worker in enumerate(self.workers):
+                alive = worker.process.is_alive()
+                # A fresh worker gets the timeout to import and connect before it must answer
+                silent = now - worker.last_pong > WORKER_HEALTH_TIMEOUT
+                if alive and not silent:
+                    worker.inbox.put({"op": "ping"})
+                    continue
+                self._restart(i, "exited" if not alive else f"silent for {now - worker.last_pong:.0f}s")
+
+    def _restart(self, index: int, reason: str):
+        worker = self.workers[index]
+        logger.error(f"Agent worker {index} {reason}; restarting it.")
+        for future in worker.in_flight.values():
+            if not future.done():
+                future.set_result(None)
+        if worker.process.is_alive():
+            worker.process.terminate()
+        self.workers[index] = self._spawn(index)
+        self.restarts += 1
+
+    async def stop(self):
+        if not self.enabled: return
+        for task in self._tasks + list(self._cancels):
+            task.cancel()
+        for worker in self.workers:
+            if worker.process.is_alive():
+                worker.inbox.put({"op": "stop"})
+        for worker in self.workers:
+            await asyncio.to_thread(worker.process.join, 10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._outbox.put(None)
+        self.workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "restarts": self.restarts, "capacity_waits": self.capacity_waits, "rpc_calls": self.rpc_calls,
+            "workers": {f"w{w.index}": {"healthy": w.healthy, "in_flight": len(w.in_flight), "turns": w.turns,
+                                        "failed": w.failed, **w.stats} for w in self.workers}
+        }
+
+worker_pool = WorkerPool()
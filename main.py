@@ -1,9 +1,23 @@
 import os, discord, asyncio, logging, json
 from discord.ext import commands
 
-from core.config import TOKEN, PREFIX
+from core.config import TOKEN, PREFIX, PROVIDER_WARMUP, MULTIPROCESS_WORKERS
 from core.database import db_manager
-from discord_bot.chat_handler import handle_chat
+from core.metrics import registry, start_metrics_server
+from core.http_client import warm_up, warmup_stats, close_http_client
+from core.semantic_index import semantic_index
+from agent.agent_factory import agent_pool
+from agent.agent_storage import agent_storage
+from agent.memory_worker import memory_worker
+from agent.channel_summarizer import channel_summarizer
+from agent.key_pool import key_pool
+from agent.model_router import model_router
+from agent.prompt_layout import prefix_cache_stats
+from tools.web_tools import tool_cache_stats, get_exa_client, get_firecrawl_client
+from discord_bot.image_pipeline import image_pipeline
+from discord_bot.turn_scheduler import turn_scheduler
+from discord_bot.worker_pool import worker_pool
+from discord_bot.context_cache import context_cache
 from tools.bio_tools import BioTools
 
 class JSONFormatter(logging.Formatter):
@@ -20,9 +34,49 @@ handler.setFormatter(JSONFormatter())
 logging.basicConfig(level=logging.INFO, handlers=[handler])
 logger = logging.getLogger("Main")
 
-bot = commands.Bot(command_prefix=PREFIX, self_bot=True, help_command=None)
+class HeroBot(commands.Bot):
+    async def close(self):
+        # Flush write-behind buffers before the loop goes away
+        await worker_pool.stop()
+        await memory_worker.drain()
+        await channel_summarizer.drain()
+        await semantic_index.close()
+        await db_manager.close()
+        await agent_storage.drain()
+        await close_http_client()
+        await super().close()
+
+bot = HeroBot(command_prefix=PREFIX, self_bot=True, help_command=None)
 
 bio_tools_instance = None
+metrics_server = None
+
+def register_metric_collectors():
+    """Exports each subsystem's stats() as gauges on the /metrics endpoint."""
+    registry.register_collector("agent_pool", agent_pool.stats)
+    registry.register_collector("agent_storage", agent_storage.stats)
+    registry.register_collector("keys", key_pool.stats)
+    registry.register_collector("router", model_router.stats)
+    registry.register_collector("tool_cache", tool_cache_stats)
+    registry.register_collector("ingest", db_manager.ingest_metrics)
+    registry.register_collector("context_cache", context_cache.stats)
+    registry.register_collector("scheduler", turn_scheduler.stats)
+    registry.register_collector("memory", memory_worker.stats)
+    registry.register_collector("summaries", channel_summarizer.stats)
+    registry.register_collector("prefix_cache", prefix_cache_stats.stats)
+    registry.register_collector("images", image_pipeline.stats)
+    registry.register_collector("warmup", lambda: warmup_stats)
+    registry.register_collector("semantic_index", semantic_index.stats)
+    registry.register_collector("worker_pool", worker_pool.stats)
+
+async def warm_up_providers():
+    """Pre-connects to every configured LLM provider and builds the tool clients off-loop."""
+    await asyncio.gather(
+        warm_up(key_pool.endpoints()),
+        asyncio.to_thread(get_exa_client),
+        asyncio.to_thread(get_firecrawl_client),
+        return_exceptions=True
+    )
 
 async def index_historical_messages():
     """
@@ -52,7 +106,8 @@ async def index_historical_messages():
                 if msg.content:
                     await db_manager.store_message(
                         msg.id, msg.channel.id, msg.author.id,
-                        msg.author.display_name, msg.content, msg.created_at
+                        msg.author.display_name, msg.content, msg.created_at,
+                        guild_id=msg.guild.id if msg.guild else None
                     )
                     total_indexed += 1
         except Exception:
@@ -62,11 +117,28 @@ async def index_historical_messages():
 
 @bot.event
 async def on_ready():
-    global bio_tools_instance
+    global bio_tools_instance, metrics_server
     logger.info(f"✅ Logged in as: {bot.user}")
     await db_manager.init()
+    await agent_storage.init()
+    # Rows stored before messages had a guild_id get it from the channels we can see
+    channel_guilds = {ch.id: g.id for g in bot.guilds for ch in g.text_channels}
+    db_manager.start_guild_backfill(channel_guilds)
+    semantic_index.start(channel_guilds)
     
-    bio_tools_instance = BioTools(bot)
+    # on_ready fires again after reconnects; keep the same toolkit so pooled agents stay valid
+    if bio_tools_instance is None:
+        bio_tools_instance = BioTools(bot)
+
+    if metrics_server is None:
+        register_metric_collectors()
+        registry.register_collector("user_lookup", bio_tools_instance.lookup.stats)
+        metrics_server = await start_metrics_server()
+        if PROVIDER_WARMUP and not MULTIPROCESS_WORKERS:
+            asyncio.create_task(warm_up_providers())
+
+    # Agent work moves to worker processes; they call back here for Discord lookups
+    worker_pool.start(bot, bio_tools_instance.lookup, semantic_index)
     
     # Run indexing in background to avoid blocking the bot's availability
     asyncio.create_task(index_historical_messages())
@@ -76,19 +148,25 @@ async def on_ready():
 async def on_message(message):
     # Log everything to keep memories fresh
     if message.content:
+        context_cache.record_message(
+            message.channel.id, message.id, message.author.id,
+            message.author.display_name, message.content
+        )
         await db_manager.store_message(
             message.id, message.channel.id, message.author.id, 
-            message.author.display_name, message.content, message.created_at
+            message.author.display_name, message.content, message.created_at,
+            guild_id=message.guild.id if message.guild else None
         )
+        channel_summarizer.observe(message.channel.id)
 
     if message.author.id == bot.user.id:
         if message.content.startswith(PREFIX):
-            await handle_chat(message, bot, bio_tools_instance)
+            turn_scheduler.submit(message, bot, bio_tools_instance)
         return
 
     # Respond to prefix or direct mentions
     if message.content.startswith(PREFIX):
-        await handle_chat(message, bot, bio_tools_instance)
+        turn_scheduler.submit(message, bot, bio_tools_instance)
 
 if __name__ == "__main__":
     if not TOKEN:
@@ -3,42 +3,58 @@ from agno.tools.function import ToolResult
 from agno.media import Image
 from core.execution_context import get_current_channel
 from core.database import db_manager
+from core.semantic_index import semantic_index, reciprocal_rank_fusion
+from core.metrics import traced_tool
+from tools.user_lookup import UserLookup
+from core.config import TOOL_OUTPUT_TOKEN_BUDGET
+from agent.context_budget import fit_tool_output
+import asyncio
 import logging
 import discord
-from typing import Optional, Union, List
+from typing import Optional, Union, Tuple
 
 logger = logging.getLogger(__name__)
 
 class BioTools(Toolkit):
-    def __init__(self, bot: discord.Client):
+    def __init__(self, bot: Optional[discord.Client], lookup=None, semantic=None):
+        """`lookup` / `semantic` replace the in-process ones in agent worker processes."""
         super().__init__(name="bio_tools")
         self.bot = bot
+        self.lookup = lookup or UserLookup(bot)
+        self.semantic = semantic or semantic_index
         self.register(self.get_user_details)
         self.register(self.get_user_avatar)
         self.register(self.recall_personality_profile)
         self.register(self.search_chat_history) # NEW TOOL ADDED
 
     # --- NEW HELPER TO FIX IDENTITY MISMATCH ---
-    async def _get_server_channels(self) -> List[int]:
-        """Helper to get all text channel IDs in the current server to fix scope."""
+    def _get_scope(self) -> Tuple[Optional[int], Optional[int]]:
+        """(guild_id, channel_id) of the current conversation; guild_id is None in DMs."""
         channel = get_current_channel()
-        channel_ids = []
-        if channel and hasattr(channel, 'guild') and channel.guild:
-            for ch in channel.guild.text_channels:
-                channel_ids.append(ch.id)
-        if not channel_ids and hasattr(channel, 'id'):
-            channel_ids = [channel.id]
-        return channel_ids
+        guild = getattr(channel, 'guild', None)
+        return (guild.id if guild else None), getattr(channel, 'id', None)
 
     # --- NEW TOOL FOR "WHAT HAPPENED" QUERIES ---
+    @traced_tool
     async def search_chat_history(self, query: str) -> str:
         """
         Searches chat logs for events, actions, or specific keywords within the current server.
+        Matches by keyword and by meaning, so one descriptive query is usually enough.
         USE THIS when asked: "What did he do?", "What happened?", "Did I mention X?".
         """
         try:
-            c_ids = await self._get_server_channels()
-            messages = await db_manager.search_content_by_keyword(query, c_ids, limit=50)
+            guild_id, channel_id = self._get_scope()
+            keyword_hits, semantic_ids = await asyncio.gather(
+                db_manager.search_content_by_keyword(query, guild_id, channel_id, limit=50),
+                self.semantic.search(query, guild_id, channel_id)
+            )
+            messages = keyword_hits
+            if semantic_ids:
+                # Fuse both rankings; semantic-only hits are fetched by id
+                by_id = {m['message_id']: m for m in keyword_hits}
+                by_id.update(await db_manager.get_messages_by_ids([i for i in semantic_ids if i not in by_id]))
+                fused = reciprocal_rank_fusion([m['message_id'] for m in keyword_hits], semantic_ids)
+                messages = [by_id[i] for i in fused[:50] if i in by_id]
             
             if not messages:
                 return f"I searched the logs for '{query}' in this server but found nothing."
@@ -48,10 +64,11 @@ class BioTools(Toolkit):
                 timestamp = msg['created_at'].strftime('%Y-%m-%d %H:%M')
                 log_text.append(f"[{timestamp}] {msg['author_name']}: {msg['content']}")
             
-            return "\n".join(log_text)
+            return fit_tool_output("\n".join(log_text), TOOL_OUTPUT_TOKEN_BUDGET, keep="tail")
         except Exception as e:
             return f"Search Error: {e}"
 
+    @traced_tool
     async def recall_personality_profile(self, name: str) -> str:
         """
         Recalls everything I know about a person from my long-term global memory.
@@ -63,8 +80,8 @@ class BioTools(Toolkit):
         """
         try:
             # --- UPDATE: USE SERVER SCOPE FIRST TO FIX MISMATCHES ---
-            c_ids = await self._get_server_channels()
-            messages = await db_manager.search_messages_in_batches(name, c_ids, limit=100)
+            guild_id, channel_id = self._get_scope()
+            messages = await db_manager.search_messages_in_batches(name, guild_id, channel_id, limit=100)
             
             if not messages:
                 # Fallback to global only if needed
@@ -79,33 +96,35 @@ class BioTools(Toolkit):
                 timestamp = msg['created_at'].strftime('%Y-%m-%d %H:%M')
                 log_text.append(f"[{timestamp}] {msg['content']}")
             
-            return "\n".join(log_text)
+            return fit_tool_output("\n".join(log_text), TOOL_OUTPUT_TOKEN_BUDGET, keep="tail")
         except Exception as e:
             logger.error(f"Recall failed: {e}")
             return "My memory is a bit fuzzy on that person right now."
 
+    @traced_tool
     async def get_user_details(self, user_id: Union[int, str]) -> str:
         """Fetches technical Discord profile details."""
         channel = get_current_channel()
         try:
             u_id = int(user_id)
-            user = await self.bot.fetch_user(u_id)
+            user = await self.lookup.get_user(u_id)
             details = [f"Name: {user.name}", f"ID: {user.id}", f"Display: {user.display_name}"]
             
             if channel and hasattr(channel, 'guild') and channel.guild:
                 try:
-                    member = await channel.guild.fetch_member(u_id)
+                    member = await self.lookup.get_member(channel.guild, u_id)
                     details.append(f"Joined Server: {member.joined_at.strftime('%Y-%m-%d')}")
                 except: pass 
             return "\n".join(details)
         except Exception as e:
             return f"Error: {e}"
 
+    @traced_tool
     async def get_user_avatar(self, user_id: Union[int, str]) -> ToolResult:
         """Fetches a user's avatar."""
         try:
             u_id = int(user_id)
-            user = await self.bot.fetch_user(u_id)
+            user = await self.lookup.get_user(u_id)
             url = user.avatar.url if user.avatar else user.default_avatar.url
             return ToolResult(content=f"Here is {user.name}'s face.", images=[Image(url=url)])
         except Exception as e:
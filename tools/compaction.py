@@ -0,0 +1,149 @@
+import re, math, logging
+from collections import Counter
+from typing import Dict, List, Tuple
+from core.config import TOOL_PASSAGE_CHARS, TOOL_DEDUPE_THRESHOLD
+from agent.context_budget import estimate_tokens, truncate_to_budget
+
+# NumPy is optional; scoring falls back to plain Python loops
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger("Compaction")
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_BLOCK = re.compile(r"\n\s*\n|\n(?=#)")
+_FRAGMENT_CHARS = 60  # shorter units (headings, captions) are glued to the next passage
+_STOPWORDS = frozenset("a an and are as at be by for from has have in is it its of on or that the this to was were will with what who how when where why do does did".split())
+
+def _terms(text: str) -> List[str]:
+    return [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+
+def split_passages(text: str, target_chars: int = TOOL_PASSAGE_CHARS) -> List[str]:
+    """
+    One passage per paragraph; long paragraphs are cut at sentence ends into pieces of
+    about `target_chars`, and tiny fragments (headings, captions) join the next passage.
+    """
+    units = []
+    for block in _BLOCK.split(text or ""):
+        block = " ".join(block.split())
+        if not block: continue
+        if len(block) <= target_chars:
+            units.append(block)
+            continue
+        current = ""
+        for sentence in _SENTENCE_END.split(block):
+            if current and len(current) + len(sentence) + 1 > target_chars:
+                units.append(current)
+                current = ""
+            current = f"{current} {sentence}".strip()
+            while len(current) > target_chars * 2:  # a single run-on "sentence"
+                units.append(current[:target_chars])
+                current = current[target_chars:]
+        if current:
+            units.append(current)
+
+    passages, prefix = [], ""
+    for unit in units:
+        if len(unit) < _FRAGMENT_CHARS:
+            prefix = f"{prefix} {unit}".strip()
+            continue
+        passages.append(f"{prefix} {unit}".strip())
+        prefix = ""
+    if prefix:
+        passages.append(prefix)
+    return passages
+
+def bm25_scores(query: str, passages: List[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """BM25 of every passage against `query`; one term-frequency matrix, scored at once."""
+    q_terms = list(dict.fromkeys(_terms(query)))
+    if not q_terms or not passages: return [0.0] * len(passages)
+    counts = [Counter(_terms(p)) for p in passages]
+    lengths = [sum(c.values()) for c in counts]
+    n, avg_len = len(passages), (sum(lengths) / len(passages)) or 1.0
+    if np is not None:
+        tf = np.array([[c[t] for t in q_terms] for c in counts], dtype=np.float32)
+        df = (tf > 0).sum(axis=0)
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * np.array(lengths, dtype=np.float32) / avg_len)
+        return ((tf * (k1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1).tolist()
+    df = {t: sum(1 for c in counts if c[t]) for t in q_terms}
+    idf = {t: math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5)) for t in q_terms}
+    scores = []
+    for c, length in zip(counts, lengths):
+        norm = k1 * (1 - b + b * length / avg_len)
+        scores.append(sum(idf[t] * c[t] * (k1 + 1) / (c[t] + norm) for t in q_terms if c[t]))
+    return scores
+
+def _shingles(text: str) -> frozenset:
+    words = _WORD.findall(text.lower())
+    return frozenset(zip(words, words[1:], words[2:])) or frozenset(words)
+
+def _near_duplicate(shingles: frozenset, kept: List[frozenset], threshold: float) -> bool:
+    for other in kept:
+        union = len(shingles | other)
+        if union and len(shingles & other) / union >= threshold:
+            return True
+    return False
+
+def compact(query: str, documents: List[Dict[str, str]], budget: int) -> str:
+    """
+    Turns tool documents ({"title", "url", "date", "text"}) into the best passages for
+    `query` within `budget` tokens: passages are ranked with BM25 across all documents,
+    near-duplicates (e.g. the same boilerplate on several pages) are dropped, and the
+    survivors are printed per source in their original order.
+    """
+    passages: List[Tuple[int, int, str]] = []  # (doc index, position, text)
+    for d, doc in enumerate(documents):
+        passages += [(d, i, p) for i, p in enumerate(split_passages(doc.get("text", "")))]
+
+    scores = bm25_scores(query, [p for _, _, p in passages])
+    # Ties (and an empty query) keep reading order, so the lead of each page wins;
+    # once anything matches, passages that match nothing are not worth the tokens
+    order = sorted(range(len(passages)), key=lambda i: (-scores[i], passages[i][1], passages[i][0]))
+    if any(scores):
+        order = [i for i in order if scores[i] > 0]
+
+    headers = {d: _header(d, doc) for d, doc in enumerate(documents)}
+    used = sum(estimate_tokens(h) for h in headers.values())
+    chosen: Dict[int, str] = {}
+    kept_shingles: List[frozenset] = []
+    for i in order:
+        if used >= budget: break  # the headers alone can use up a small budget
+        text = passages[i][2]
+        shingles = _shingles(text)
+        if _near_duplicate(shingles, kept_shingles, TOOL_DEDUPE_THRESHOLD): continue
+        cost = estimate_tokens(text) + 1
+        if used + cost > budget:
+            if chosen: continue  # a shorter passage may still fit
+            text, cost = truncate_to_budget(text, budget - used), budget - used
+        chosen[i] = text
+        kept_shingles.append(shingles)
+        used += cost
+
+    by_doc: Dict[int, List[str]] = {}
+    for i in sorted(chosen, key=lambda i: passages[i][:2]):
+        by_doc.setdefault(passages[i][0], []).append(chosen[i])
+    if passages and not by_doc:
+        # Not even one passage fit next to the headers: list the sources within the budget
+        return truncate_to_budget("\n".join(headers.values()), budget)
+    sections = []
+    for d in range(len(documents)):
+        if d in by_doc or not passages:
+            sections.append("\n".join([headers[d]] + by_doc.get(d, [])))
+    return "\n\n".join(sections)
+
+def _header(index: int, doc: Dict[str, str]) -> str:
+    meta = ", ".join(x for x in (doc.get("url"), doc.get("date")) if x)
+    return f"[{index + 1}] {doc.get('title') or 'Untitled'}" + (f" ({meta})" if meta else "")
+
+def parse_exa_results(response) -> List[Dict[str, str]]:
+    """Keeps only what the model reads from an Exa search response."""
+    documents = []
+    for r in getattr(response, "results", None) or []:
+        date = (getattr(r, "published_date", None) or "")[:10]
+        documents.append({"title": getattr(r, "title", None) or "", "url": getattr(r, "url", None) or "",
+                          "date": date, "text": getattr(r, "text", None) or ""})
+    return documents
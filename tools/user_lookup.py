@@ -0,0 +1,61 @@
+import asyncio, logging, discord
+from typing import Awaitable, Callable, Dict, Hashable
+from core.cache import TTLCache
+from core.config import USER_CACHE_SIZE, USER_CACHE_TTL
+
+logger = logging.getLogger("UserLookup")
+
+class UserLookup:
+    """
+    Resolves users and members without a REST call when possible: the client's gateway
+    cache first, then a TTL cache of earlier REST results. Concurrent lookups for the
+    same ID share one in-flight request.
+    """
+    def __init__(self, bot: discord.Client):
+        self.bot = bot
+        self.users = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+        self.members = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.gateway_hits = 0
+        self.rest_calls = 0
+        self.deduped = 0
+
+    async def _fetch_once(self, key: Hashable, cache: TTLCache, fetch: Callable[[], Awaitable]):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.deduped += 1
+            return await asyncio.shield(task)
+        self.rest_calls += 1
+        task = asyncio.create_task(fetch())
+        self._inflight[key] = task
+        try:
+            result = await asyncio.shield(task)
+            cache.set(key, result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_user(self, user_id: int):
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            self.gateway_hits += 1
+            return user
+        cached = self.users.get(user_id)
+        if cached is not None:
+            return cached
+        return await self._fetch_once(user_id, self.users, lambda: self.bot.fetch_user(user_id))
+
+    async def get_member(self, guild: discord.Guild, user_id: int):
+        member = guild.get_member(user_id)
+        if member is not None:
+            self.gateway_hits += 1
+            return member
+        key = (guild.id, user_id)
+        cached = self.members.get(key)
+        if cached is not None:
+            return cached
+        return await self._fetch_once(key, self.members, lambda: guild.fetch_member(user_id))
+
+    def stats(self) -> Dict[str, object]:
+        return {"gateway_hits": self.gateway_hits, "rest_calls": self.rest_calls, "deduped": self.deduped,
+                "users": self.users.stats(), "members": self.members.stats()}
@@ -0,0 +1,162 @@
+import json, asyncio, logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit
+from typing import Any, Dict, Optional
+from core.config import *
+from core.cache import TTLCache
+from core.database import db_manager
+from core.metrics import traced_tool
+from core.execution_context import get_current_query
+from tools.compaction import compact, parse_exa_results
+
+logger = logging.getLogger("WebTools")
+
+# --- GLOBAL TOOL CLIENTS (built on first use; the SDK imports are slow and most turns never need them) ---
+_clients: Dict[str, Any] = {}
+
+def get_exa_client():
+    if "exa" not in _clients:
+        from exa_py import Exa
+        _clients["exa"] = Exa(api_key=EXA_API_KEY) if EXA_API_KEY else None
+    return _clients["exa"]
+
+def get_firecrawl_client():
+    if "firecrawl" not in _clients:
+        try:
+            from firecrawl import FirecrawlApp
+        except ImportError:
+            FirecrawlApp = None
+        _clients["firecrawl"] = FirecrawlApp(api_key=FIRECRAWL_API_KEY) if FIRECRAWL_API_KEY and FirecrawlApp else None
+    return _clients["firecrawl"]
+
+# The Exa / Firecrawl SDKs are blocking, so they run in a dedicated, bounded pool
+# instead of on the event loop (or the default executor other code relies on).
+_tool_executor = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="web-tool")
+_search_slots = asyncio.Semaphore(WEB_SEARCH_CONCURRENCY)
+_scrape_slots = asyncio.Semaphore(SCRAPE_CONCURRENCY)
+
+async def _run_blocking(slots: asyncio.Semaphore, timeout: float, fn, *args, **kwargs):
+    """
+    Runs a blocking client call in the tool pool, limited by `slots` and `timeout`.
+    A timed-out thread cannot be stopped, so its slot is only freed once it really ends.
+    """
+    await slots.acquire()
+    try:
+        future = asyncio.get_running_loop().run_in_executor(_tool_executor, lambda: fn(*args, **kwargs))
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    # shield: giving up on the call must not cancel (and so complete) the executor future
+    return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+
+# --- RESULT CACHE ---
+class ToolResultCache:
+    """
+    Per-tool TTL + LRU cache in memory, optionally backed by the `tool_cache` table
+    so results survive restarts (TOOL_CACHE_PERSIST=true).
+    """
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.memory = TTLCache(TOOL_CACHE_SIZE, TOOL_CACHE_TTL)
+        self.db_hits = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and TOOL_CACHE_PERSIST:
+            value = await db_manager.get_tool_cache(self.kind, key, TOOL_CACHE_TTL)
+            if value is not None:
+                self.db_hits += 1
+                self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if TOOL_CACHE_PERSIST:
+            await db_manager.set_tool_cache(self.kind, key, value)
+
+    def stats(self) -> Dict[str, float]:
+        return {**self.memory.stats(), "db_hits": self.db_hits}
+
+# Parsed results / raw markdown; compaction happens per call against the prompt
+search_cache = ToolResultCache("web_search_results")
+scrape_cache = ToolResultCache("scrape_markdown")
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def normalize_url(url: str) -> str:
+    """Lowercases scheme/host and drops fragments and trailing slashes."""
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+def _rank_query(tool_query: str = "") -> str:
+    """What results are ranked against: the tool's own query plus the user's prompt."""
+    return f"{tool_query} {get_current_query() or ''}".strip()
+
+def tool_cache_stats() -> Dict[str, Dict[str, float]]:
+    return {"web_search": search_cache.stats(), "scrape_website": scrape_cache.stats()}
+
+@traced_tool
+async def web_search(query: str) -> str:
+    """
+    Searches the web for up-to-date information.
+
+    Args:
+        query (str): What to search for.
+    """
+    if not EXA_API_KEY: return "Error: Exa Client not initialized."
+    # The parsed results are cached; compaction depends on the prompt, so it runs per call
+    cache_key = normalize_query(query)
+    cached = await search_cache.get(cache_key)
+    try:
+        if cached is None:
+            exa_client = await asyncio.to_thread(get_exa_client)
+            response = await _run_blocking(
+                _search_slots, WEB_SEARCH_TIMEOUT,
+                exa_client.search_and_contents, query, num_results=EXA_NUM_RESULTS, text=True
+            )
+            cached = json.dumps(parse_exa_results(response))
+            await search_cache.set(cache_key, cached)
+        documents = json.loads(cached)
+        if not documents: return f"No web results for '{query}'."
+        return await asyncio.to_thread(compact, _rank_query(query), documents, TOOL_OUTPUT_TOKEN_BUDGET)
+    except asyncio.TimeoutError:
+        logger.warning(f"Exa search timed out after {WEB_SEARCH_TIMEOUT}s")
+        return "Error: Web search timed out."
+    except Exception as e:
+        logger.error(f"Exa search failed: {e}")
+        return "Error: Web search failed."
+
+@traced_tool
+async def scrape_website(url: str) -> str:
+    """
+    Reads the content of a web page as markdown.
+
+    Args:
+        url (str): The page to read.
+    """
+    if not FIRECRAWL_API_KEY: return "Error: Firecrawl Client not initialized."
+    cache_key = normalize_url(url)
+    markdown = await scrape_cache.get(cache_key)
+    try:
+        if markdown is None:
+            firecrawl_client = await asyncio.to_thread(get_firecrawl_client)
+            if not firecrawl_client: return "Error: Firecrawl Client not initialized."
+            result = await _run_blocking(
+                _scrape_slots, SCRAPE_TIMEOUT,
+                firecrawl_client.scrape_url, url, params={'formats': ['markdown']}
+            )
+            markdown = result.get('markdown', '')[:SCRAPE_MAX_CHARS]
+            await scrape_cache.set(cache_key, markdown)
+        if not markdown: return "No content."
+        # Without a prompt the ranking is empty and the page is kept from the top
+        document = {"title": "", "url": url, "text": markdown}
+        return await asyncio.to_thread(compact, _rank_query(), [document], TOOL_OUTPUT_TOKEN_BUDGET)
+    except asyncio.TimeoutError:
+        logger.warning(f"Firecrawl scrape timed out after {SCRAPE_TIMEOUT}s: {url}")
+        return "Error: Website scraping timed out."
+    except Exception as e:
+        logger.error(f"Firecrawl scrape failed: {e}")
+        return "Error: Website scraping failed."